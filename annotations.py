@@ -0,0 +1,404 @@
+"""
+Векторный слой аннотаций: линии поверх обработанного изображения.
+
+Линии хранятся не как отдельные операции цепочки (каждая из которых
+копировала бы весь кадр), а компактными массивами координат, толщин и
+цветов. Слой растеризуется пакетами вызовов cv2.polylines - по одному
+на группу линий одного цвета и толщины - в разрешении предпросмотра
+для отображения и один раз в полном разрешении при экспорте. Результат
+побитово совпадает с последовательным рисованием operations.draw_line.
+
+Пространственный индекс (равномерная сетка) позволяет быстро найти
+линию под курсором для выбора и удаления.
+"""
+
+import math
+from collections import defaultdict
+
+import cv2  # pylint: disable=import-error
+import numpy as np
+
+import operations
+
+GRID_CELL = 256     # Сторона ячейки пространственного индекса, пикс.
+SCALE_MARGIN = 2    # Запас области перерисовки на уменьшенной копии, пикс.
+
+
+class LineLayer:
+    """
+    Линии в порядке рисования со стабильными идентификаторами.
+
+    Идентификаторы выдаются по возрастанию и не меняются при правке и
+    удалении других линий; позиция линии в массивах находится по
+    идентификатору двоичным поиском.
+    """
+
+    def __init__(self, cell_size=GRID_CELL):
+        """
+        Аргументы:
+            cell_size (int): Сторона ячейки пространственного индекса
+        """
+        self.cell_size = cell_size
+        self.count = 0
+        self._ids = np.empty(0, dtype=np.int64)
+        self._coords = np.empty((0, 4), dtype=np.int32)  # x1, y1, x2, y2
+        self._thickness = np.empty(0, dtype=np.int32)
+        self._colors = np.empty((0, 3), dtype=np.uint8)
+        self._next_id = 0
+        # (столбец, строка) -> идентификаторы; строится при первом поиске
+        self._cells = None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def ids(self):
+        """Идентификаторы линий в порядке рисования."""
+        return self._ids[:self.count].tolist()
+
+    def copy(self):
+        """Независимая копия слоя (без индекса) для фоновой задачи."""
+        layer = LineLayer(self.cell_size)
+        layer.count = self.count
+        layer._ids = self._ids[:self.count].copy()
+        layer._coords = self._coords[:self.count].copy()
+        layer._thickness = self._thickness[:self.count].copy()
+        layer._colors = self._colors[:self.count].copy()
+        layer._next_id = self._next_id
+        return layer
+
+    def _reserve(self, count):
+        """Увеличение емкости массивов (вдвое) до count записей."""
+        capacity = len(self._ids)
+        if count <= capacity:
+            return
+        capacity = max(count, 2 * capacity, 16)
+        for attr in ("_ids", "_coords", "_thickness", "_colors"):
+            old = getattr(self, attr)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, attr, new)
+
+    def _row(self, line_id):
+        """Позиция линии в массивах."""
+        row = int(np.searchsorted(self._ids[:self.count], line_id))
+        if row == self.count or self._ids[row] != line_id:
+            raise KeyError(f"Нет линии с идентификатором {line_id}")
+        return row
+
+    def add(self, start, end, thickness, color=operations.LINE_COLOR):
+        """
+        Добавление линии поверх остальных.
+
+        Аргументы:
+            start (tuple): Начальная точка (x, y)
+            end (tuple): Конечная точка (x, y)
+            thickness (int): Толщина линии
+            color (tuple): Цвет линии в RGB
+
+        Возвращает:
+            int: Идентификатор линии
+        """
+        self._reserve(self.count + 1)
+        row = self.count
+        line_id = self._next_id
+        self._next_id += 1
+        self._ids[row] = line_id
+        self._coords[row] = (*start, *end)
+        self._thickness[row] = thickness
+        self._colors[row] = color
+        self.count += 1
+        self._index(row, add=True)
+        return line_id
+
+    def restore(self, line_id, start, end, thickness,
+                color=operations.LINE_COLOR):
+        """
+        Возврат удаленной линии с прежним идентификатором.
+
+        Линия встает на свое место в порядке рисования, так как
+        идентификаторы возрастают в этом порядке.
+
+        Аргументы:
+            line_id (int): Идентификатор удаленной линии
+            start (tuple): Начальная точка (x, y)
+            end (tuple): Конечная точка (x, y)
+            thickness (int): Толщина линии
+            color (tuple): Цвет линии в RGB
+
+        Исключения:
+            KeyError: Линия с таким идентификатором уже есть
+        """
+        row = int(np.searchsorted(self._ids[:self.count], line_id))
+        if row < self.count and self._ids[row] == line_id:
+            raise KeyError(f"Линия с идентификатором {line_id} уже есть")
+        self._reserve(self.count + 1)
+        for array in (self._ids, self._coords, self._thickness,
+                      self._colors):
+            array[row + 1:self.count + 1] = array[row:self.count]
+        self._ids[row] = line_id
+        self._coords[row] = (*start, *end)
+        self._thickness[row] = thickness
+        self._colors[row] = color
+        self.count += 1
+        self._next_id = max(self._next_id, line_id + 1)
+        self._index(row, add=True)
+
+    def update(self, line_id, start, end, thickness, color=None):
+        """Изменение линии с сохранением ее места в порядке рисования."""
+        row = self._row(line_id)
+        self._index(row, add=False)
+        self._coords[row] = (*start, *end)
+        self._thickness[row] = thickness
+        if color is not None:
+            self._colors[row] = color
+        self._index(row, add=True)
+
+    def remove(self, line_id):
+        """Удаление линии."""
+        row = self._row(line_id)
+        self._index(row, add=False)
+        for array in (self._ids, self._coords, self._thickness,
+                      self._colors):
+            array[row:self.count - 1] = array[row + 1:self.count]
+        self.count -= 1
+
+    def clear(self):
+        """Удаление всех линий."""
+        self.count = 0
+        if self._cells is not None:
+            self._cells.clear()
+
+    def get(self, line_id):
+        """Параметры линии в формате операции line рецепта."""
+        return self._params(self._row(line_id))
+
+    def _params(self, row):
+        """Параметры линии по позиции в массивах."""
+        x1, y1, x2, y2 = self._coords[row].tolist()
+        params = {"start": (x1, y1), "end": (x2, y2),
+                  "thickness": int(self._thickness[row])}
+        color = tuple(self._colors[row].tolist())
+        if color != operations.LINE_COLOR:
+            params["color"] = color
+        return params
+
+    def to_recipe(self):
+        """Линии слоя как операции line рецепта."""
+        return [("line", self._params(row)) for row in range(self.count)]
+
+    def bounds(self, coords=None, thickness=None):
+        """
+        Ограничивающие прямоугольники линий с запасом на толщину.
+
+        Аргументы:
+            coords (np.ndarray): Координаты (N, 4) (по умолчанию - слоя)
+            thickness (np.ndarray): Толщины (N,) (по умолчанию - слоя)
+
+        Возвращает:
+            np.ndarray: Прямоугольники (N, 4) как x0, y0, x1, y1
+        """
+        if coords is None:
+            coords = self._coords[:self.count]
+            thickness = self._thickness[:self.count]
+        coords = coords.astype(np.int64)
+        thickness = thickness.astype(np.int64)
+        return np.stack([
+            np.minimum(coords[:, 0], coords[:, 2]) - thickness,
+            np.minimum(coords[:, 1], coords[:, 3]) - thickness,
+            np.maximum(coords[:, 0], coords[:, 2]) + thickness + 1,
+            np.maximum(coords[:, 1], coords[:, 3]) + thickness + 1,
+        ], axis=1)
+
+    # Пространственный индекс
+
+    def _cells_of(self, row):
+        """
+        Ячейки сетки, через которые проходит линия с запасом на
+        толщину.
+
+        Строки сетки перебираются по полосам, и в каждой полосе берется
+        только отрезок линии внутри нее, поэтому длинная диагональ не
+        заполняет весь свой ограничивающий прямоугольник.
+        """
+        size = self.cell_size
+        x1, y1, x2, y2 = self._coords[row].tolist()
+        margin = int(self._thickness[row])
+        top, bottom = min(y1, y2), max(y1, y2)
+        for cell_row in range(math.floor((top - margin) / size),
+                              math.floor((bottom + margin) / size) + 1):
+            band_top = max(top, cell_row * size - margin)
+            band_bottom = min(bottom, (cell_row + 1) * size + margin)
+            if y1 == y2:
+                xa, xb = x1, x2
+            else:
+                xa = x1 + (x2 - x1) * (band_top - y1) / (y2 - y1)
+                xb = x1 + (x2 - x1) * (band_bottom - y1) / (y2 - y1)
+            for cell_col in range(
+                    math.floor((min(xa, xb) - margin) / size),
+                    math.floor((max(xa, xb) + margin) / size) + 1):
+                yield cell_col, cell_row
+
+    def _index(self, row, add):
+        """Добавление линии в индекс или удаление из него."""
+        if self._cells is None:
+            return
+        line_id = int(self._ids[row])
+        for cell in self._cells_of(row):
+            if add:
+                self._cells[cell].add(line_id)
+            else:
+                self._cells[cell].discard(line_id)
+                if not self._cells[cell]:
+                    del self._cells[cell]
+
+    def _build_index(self):
+        """Построение индекса по всем линиям."""
+        self._cells = defaultdict(set)
+        for row in range(self.count):
+            self._index(row, add=True)
+
+    def query(self, x0, y0, x1, y1):
+        """
+        Линии, которые могут пересекать прямоугольник.
+
+        Аргументы:
+            x0, y0, x1, y1 (float): Прямоугольник в координатах
+                исходного изображения
+
+        Возвращает:
+            list: Позиции линий в порядке рисования
+        """
+        if self._cells is None:
+            self._build_index()
+        size = self.cell_size
+        found = set()
+        for cell_row in range(math.floor(y0 / size),
+                              math.floor(y1 / size) + 1):
+            for cell_col in range(math.floor(x0 / size),
+                                  math.floor(x1 / size) + 1):
+                found.update(self._cells.get((cell_col, cell_row), ()))
+        if not found:
+            return []
+        return np.searchsorted(self._ids[:self.count],
+                               sorted(found)).tolist()
+
+    def hit_test(self, x, y, tolerance=0.0):
+        """
+        Линия под точкой.
+
+        Аргументы:
+            x (float): Координата X в исходном изображении
+            y (float): Координата Y в исходном изображении
+            tolerance (float): Допуск сверх половины толщины, пикс.
+
+        Возвращает:
+            int: Идентификатор ближайшей линии (из равноудаленных -
+            нарисованной последней) или None
+        """
+        rows = self.query(x - tolerance, y - tolerance,
+                          x + tolerance, y + tolerance)
+        if not rows:
+            return None
+        coords = self._coords[rows].astype(np.float64)
+        start, end = coords[:, :2], coords[:, 2:]
+        direction = end - start
+        length = (direction ** 2).sum(axis=1)
+        # Проекция точки на отрезок (вырожденный отрезок - точка)
+        along = np.divide(((x, y) - start) * direction,
+                          length[:, np.newaxis],
+                          out=np.zeros_like(direction),
+                          where=length[:, np.newaxis] > 0).sum(axis=1)
+        nearest = start + np.clip(along, 0, 1)[:, np.newaxis] * direction
+        distance = np.hypot(*(nearest - (x, y)).T)
+        distance -= self._thickness[rows] / 2 + tolerance
+        best = len(rows) - 1 - int(np.argmin(distance[::-1]))
+        if distance[best] > 0:
+            return None
+        return int(self._ids[rows[best]])
+
+    # Растеризация
+
+    def scaled(self, scale=1.0):
+        """
+        Координаты и толщины для копии изображения в масштабе scale.
+
+        Округление совпадает с operations.scale_params, поэтому
+        растеризация на уровне пирамиды совпадает с цепочкой операций.
+
+        Возвращает:
+            tuple: (координаты (N, 4), толщины (N,))
+        """
+        coords = self._coords[:self.count]
+        thickness = self._thickness[:self.count]
+        if scale == 1:
+            return coords, thickness
+        return (np.rint(coords * scale).astype(np.int32),
+                np.maximum(1, np.rint(thickness * scale)).astype(np.int32))
+
+    def rasterize(self, image, scale=1.0, dst=None, regions=None):
+        """
+        Рисование линий слоя поверх изображения.
+
+        Аргументы:
+            image (np.ndarray): RGB-изображение под слоем
+            scale (float): Масштаб изображения относительно исходного
+            dst (np.ndarray): Массив для результата (может совпадать с
+                image) или None
+            regions (list): Прямоугольники (x0, y0, x1, y1) в
+                координатах исходного изображения или None. Если заданы,
+                dst уже содержит image со слоем и отличается от нового
+                результата только в этих прямоугольниках: они
+                восстанавливаются из image, и перерисовываются только
+                линии, задевающие их
+
+        Возвращает:
+            np.ndarray: RGB-изображение с линиями
+        """
+        coords, thickness = self.scaled(scale)
+        if regions is None or dst is None or dst is image or \
+                len(np.unique(self._colors[:self.count], axis=0)) > 1:
+            # Перерисовка части линий затирает и их пиксели вне областей,
+            # что допустимо, только если все линии одного цвета
+            result = operations.apply_channel(image, "all", dst)
+            self._draw(result, coords, thickness, range(self.count))
+            return result
+
+        height, width = image.shape[:2]
+        boxes = self.bounds(coords, thickness)
+        touched = np.zeros(self.count, dtype=bool)
+        for x0, y0, x1, y1 in regions:
+            x0 = max(0, math.floor(x0 * scale) - SCALE_MARGIN)
+            y0 = max(0, math.floor(y0 * scale) - SCALE_MARGIN)
+            x1 = min(width, math.ceil(x1 * scale) + SCALE_MARGIN)
+            y1 = min(height, math.ceil(y1 * scale) + SCALE_MARGIN)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            dst[y0:y1, x0:x1] = image[y0:y1, x0:x1]
+            touched |= (boxes[:, 0] < x1) & (x0 < boxes[:, 2]) & \
+                (boxes[:, 1] < y1) & (y0 < boxes[:, 3])
+        # Линии рисуются целиком: растеризация cv2 зависит от отсечения
+        # по границам холста, и рисование в подобласть сдвигает пиксели
+        self._draw(dst, coords, thickness, np.flatnonzero(touched))
+        return dst
+
+    def _draw(self, image, coords, thickness, rows):
+        """
+        Рисование выбранных линий пакетами cv2.polylines.
+
+        Порядок важен только между линиями разного цвета, поэтому
+        подряд идущие линии одного цвета рисуются вместе, по одному
+        вызову на толщину.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        if not len(rows):
+            return
+        colors = self._colors[rows]
+        # Границы серий одного цвета
+        breaks = np.flatnonzero((colors[1:] != colors[:-1]).any(axis=1)) + 1
+        for run in np.split(rows, breaks):
+            color = tuple(self._colors[run[0]].tolist())
+            widths = thickness[run]
+            for width in np.unique(widths):
+                segments = coords[run[widths == width]].reshape(-1, 2, 2)
+                cv2.polylines(image, segments, False, color, int(width))
@@ -6,18 +6,67 @@
 преобразование в оттенки серого и рисование линий.
 """
 
+import argparse
+import functools
+import os
+import time
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import cv2  # pylint: disable=import-error
-import numpy as np
-from PIL import Image, ImageTk
+
+import jobs
+import lazy
+import tracing
+
+# Модули с OpenCV, NumPy и Pillow загружаются при первом обращении или
+# в фоне после появления окна
+cv2 = lazy.LazyModule("cv2")
+annotations = lazy.LazyModule("annotations")
+camera = lazy.LazyModule("camera")
+decode_cache = lazy.LazyModule("decode_cache")
+export = lazy.LazyModule("export")
+fusion = lazy.LazyModule("fusion")
+graph = lazy.LazyModule("graph")
+history = lazy.LazyModule("history")
+video = lazy.LazyModule("video")
+operations = lazy.LazyModule("operations")
+viewer = lazy.LazyModule("viewer")
+workspace = lazy.LazyModule("workspace")
+HEAVY_MODULES = (cv2, operations, annotations, fusion, graph, decode_cache,
+                 viewer, camera, export, video, history, workspace)
+
+STARTED = time.perf_counter()  # Момент запуска для режима --startup-time
+
+PREVIEW_SIZE = 800  # Сторона предпросмотра файла и кадров камеры
+LIVE_FPS = 15       # Целевая частота живого просмотра с камеры
+# Через сколько секунд без съемки камера закрывается (0 - не закрывать);
+# повторное открытие снова пропускает первые кадры
+CAMERA_IDLE = 600
+HIT_TOLERANCE = 5   # Допуск выбора линии курсором, пикс. экрана
+EXPORT_WORKERS = 4  # Число одновременно кодируемых экспортов
+# Этапы, длительности которых показываются в строке состояния
+TIMING_STAGES = ("decode", "convert", "hash", "pyramid", "render",
+                 "annotations", "live", "tiles", "resize", "fromarray",
+                 "photo", "canvas", "encode")
 
 
 class ImageProcessingApp(tk.Tk):
     """Главный класс приложения для обработки изображений."""
 
-    def __init__(self):
-        """Инициализация приложения с настройками по умолчанию и интерфейсом"""
+    def __init__(self, camera_source=0, startup_report=False,
+                 camera_idle=CAMERA_IDLE):
+        """
+        Инициализация приложения с настройками по умолчанию и интерфейсом
+
+        Тяжелые модули загружаются и камера проверяется в фоне, уже
+        после появления окна.
+
+        Аргументы:
+            camera_source: Номер камеры, путь к видеофайлу или "synthetic"
+            startup_report (bool): Вывести длительности этапов запуска и
+                закрыть окно
+            camera_idle (float): Через сколько секунд без съемки камера
+                закрывается (0 - держать открытой до выхода)
+        """
         super().__init__()
         self.title("Image Processor PRO - Вариант 29")
         self.geometry("1200x800")
@@ -25,9 +74,12 @@ class ImageProcessingApp(tk.Tk):
 
 
         self.original_image = None  # Исходное изображение
-        self.current_image = None   # Текущее обработанное изображение
-        self.photo_image = None    # Изображение для отображения в Tkinter
-        self.camera_available = False  # Доступность камеры
+        self.zoom_var = None       # Текущий масштаб для интерфейса
+        self.shown = None          # (ключ источника, рецепт) на холсте
+        self.shown_level = None    # Уровень пирамиды на холсте
+        # (результат цепочки, он же с линиями, рецепт линий) на холсте
+        self.composite = None
+        self.camera_available = None  # Доступность камеры (None - проверка)
         self.camera_status = None  # Статус камеры в интерфейсе
         self.channel_var = None    # Переменная для выбора канала
         self.status_var = None     # Переменная для статусной строки
@@ -35,10 +87,112 @@ class ImageProcessingApp(tk.Tk):
         self.scroll_y = None       # Вертикальная прокрутка
         self.scroll_x = None       # Горизонтальная прокрутка
         self.camera_btn = None     # Кнопка для съемки с камеры
+        self.recipe_list = None    # Список операций цепочки
+        self.documents_list = None  # Список открытых изображений
+        self.memory_var = None     # Занятая изображениями память
+        self.jobs = jobs.JobExecutor(self, on_progress=self.show_progress)
+        self.background = jobs.JobExecutor(self)  # Задачи запуска
+        # Экспорты кодируются параллельно, каждый со своим ключом
+        self.exports = jobs.JobExecutor(self, workers=EXPORT_WORKERS,
+                                        on_progress=self.show_progress)
+        self.startup_report = startup_report
+        self.startup_times = {}    # Этап запуска -> время от старта, мс
+        self.camera_source = camera_source  # Источник кадров камеры
+        self.camera = None         # Сеанс захвата (открыт при съемке)
+        self.camera_idle = None    # Таймер закрытия неиспользуемой камеры
+        self.camera_timeout = camera_idle  # Время до закрытия камеры, с
+        self.live_var = None       # Переменная режима живого просмотра
+        self.live_frame = 0        # Номер последнего показанного кадра
+        self.live_busy = False     # Обрабатывается ли кадр просмотра
+        self.trace_var = None      # Переменная включения трассировки
+        self.timing_var = None     # Длительности этапов для строки состояния
+        self.folder_files = []     # Изображения папки текущего файла
+        self.file_index = None     # Индекс текущего файла в папке
+        self.current_path = None   # Путь к текущему файлу
 
         self.setup_ui()  # Настройка интерфейса
-        self.camera_available = self.check_camera()  # Проверка камеры
-        self.update_camera_status()  # Обновление статуса камеры
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.update_camera_status()  # Камера пока проверяется
+        self.bind("<Map>", self.on_first_map, add="+")
+
+    @functools.cached_property
+    def graph(self):
+        """
+        Цепочка операций активного документа.
+
+        Цепочки всех документов используют кэш результатов первой.
+        """
+        return graph.OperationGraph()
+
+    @functools.cached_property
+    def overlay(self):
+        """Векторный слой линий поверх результата цепочки."""
+        return annotations.LineLayer()
+
+    @functools.cached_property
+    def history(self):
+        """История правок цепочки и слоя линий для отмены и повтора."""
+        return history.History(self.graph, self.overlay)
+
+    @functools.cached_property
+    def workspace(self):
+        """Открытые изображения с общим бюджетом памяти."""
+        return workspace.Workspace()
+
+    @functools.cached_property
+    def decoder(self):
+        """Кэш декодированных изображений."""
+        return decode_cache.DecodeCache()
+
+    @functools.cached_property
+    def viewport(self):
+        """Отображение тайлами с масштабом."""
+        viewport = viewer.Viewport(self.canvas, on_zoom=self.on_zoom)
+        viewport.bind()
+        return viewport
+
+    def on_first_map(self, event):
+        """Фоновая загрузка модулей и проверка камеры после появления
+        окна."""
+        if event.widget is not self or "window" in self.startup_times:
+            return
+        self.mark_startup("window")
+
+        def loaded(_):
+            """Создание холста с тайлами, когда модули загружены."""
+            self.mark_startup("modules")
+            self.viewport.render()
+
+        self.background.submit(
+            "modules", lambda job: lazy.preload(*HEAVY_MODULES),
+            on_done=loaded,
+            on_error=lambda error: messagebox.showerror(
+                "Ошибка", f"Не удалось загрузить модули: {error}")
+        )
+        self.background.submit(
+            "camera", lambda job: self.check_camera(),
+            on_done=self.camera_checked,
+            on_error=lambda error: self.camera_checked(False)
+        )
+
+    def mark_startup(self, stage):
+        """Запоминание момента завершения этапа запуска."""
+        self.startup_times[stage] = (time.perf_counter() - STARTED) * 1000
+
+    def camera_checked(self, available):
+        """
+        Обновление интерфейса по результату проверки камеры.
+
+        Аргументы:
+            available (bool): Доступна ли камера
+        """
+        self.camera_available = available
+        self.update_camera_status()
+        self.mark_startup("camera")
+        if self.startup_report:
+            for stage, elapsed in self.startup_times.items():
+                print(f"{stage}: {elapsed:.0f} мс")
+            self.on_close()
 
     def setup_ui(self):
         """Настройка пользовательского интерфейса."""
@@ -73,6 +227,9 @@ class ImageProcessingApp(tk.Tk):
         self.create_load_frame(control_frame)
         self.create_channel_frame(control_frame)
         self.create_operation_frame(control_frame)
+        self.create_zoom_frame(control_frame)
+        self.create_recipe_frame(control_frame)
+        self.create_documents_frame(control_frame)
 
     def create_load_frame(self, parent):
         """Создание фрейма с кнопками загрузки, сброса и съемки."""
@@ -86,6 +243,23 @@ class ImageProcessingApp(tk.Tk):
             style='Accent.TButton'
         ).pack(pady=5)
 
+        nav_frame = ttk.Frame(load_frame)
+        nav_frame.pack(pady=5)
+        ttk.Button(
+            nav_frame,
+            text="◀",
+            width=3,
+            command=lambda: self.navigate(-1)
+        ).pack(side=tk.LEFT)
+        ttk.Button(
+            nav_frame,
+            text="▶",
+            width=3,
+            command=lambda: self.navigate(1)
+        ).pack(side=tk.LEFT)
+        self.bind("<Left>", lambda event: self.navigate(-1))
+        self.bind("<Right>", lambda event: self.navigate(1))
+
         self.camera_btn = ttk.Button(
             load_frame,
             text="Сделать снимок",
@@ -99,6 +273,39 @@ class ImageProcessingApp(tk.Tk):
             command=self.reset_image
         ).pack(pady=5)
 
+        undo_frame = ttk.Frame(load_frame)
+        undo_frame.pack(pady=5)
+        self.undo_btn = ttk.Button(
+            undo_frame,
+            text="Отменить",
+            command=self.undo,
+            state=tk.DISABLED
+        )
+        self.undo_btn.pack(side=tk.LEFT, padx=2)
+        self.redo_btn = ttk.Button(
+            undo_frame,
+            text="Повторить",
+            command=self.redo,
+            state=tk.DISABLED
+        )
+        self.redo_btn.pack(side=tk.LEFT, padx=2)
+        self.bind("<Control-z>", lambda event: self.undo())
+        self.bind("<Control-y>", lambda event: self.redo())
+        self.bind("<Control-Z>", lambda event: self.redo())
+
+        ttk.Button(
+            load_frame,
+            text="Сохранить результат",
+            command=self.export_dialog
+        ).pack(pady=5)
+        self.bind("<Control-s>", lambda event: self.export_dialog())
+
+        ttk.Button(
+            load_frame,
+            text="Обработать видео",
+            command=self.process_video_dialog
+        ).pack(pady=5)
+
         self.camera_status = ttk.Label(
             load_frame,
             text="Камера: проверка...",
@@ -106,6 +313,14 @@ class ImageProcessingApp(tk.Tk):
         )
         self.camera_status.pack(pady=5)
 
+        self.live_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            load_frame,
+            text="Живой просмотр",
+            variable=self.live_var,
+            command=self.toggle_live_preview
+        ).pack(pady=5)
+
     def create_channel_frame(self, parent):
         """Создание фрейма для выбора цветовых каналов."""
         channel_frame = ttk.LabelFrame(parent,
@@ -150,6 +365,62 @@ class ImageProcessingApp(tk.Tk):
             command=self.draw_line_dialog
         ).pack(side=tk.LEFT, padx=5)
 
+    def create_zoom_frame(self, parent):
+        """Создание фрейма управления масштабом."""
+        zoom_frame = ttk.LabelFrame(parent, text="Масштаб", padding=10)
+        zoom_frame.pack(side=tk.LEFT, padx=10)
+
+        for text, command in (
+                ("−", lambda: self.viewport.zoom_by(1 / viewer.ZOOM_STEP)),
+                ("+", lambda: self.viewport.zoom_by(viewer.ZOOM_STEP)),
+                ("1:1", lambda: self.viewport.set_zoom(1)),
+                ("Вписать", lambda: self.viewport.fit())):
+            ttk.Button(zoom_frame, text=text, width=len(text) + 2,
+                       command=command).pack(side=tk.LEFT)
+
+        self.zoom_var = tk.StringVar(value="")
+        ttk.Label(zoom_frame, textvariable=self.zoom_var,
+                  width=6).pack(side=tk.LEFT, padx=5)
+
+    def create_recipe_frame(self, parent):
+        """Создание фрейма со списком операций цепочки."""
+        recipe_frame = ttk.LabelFrame(parent, text="Рецепт", padding=10)
+        recipe_frame.pack(side=tk.LEFT, padx=10, fill=tk.Y)
+
+        self.recipe_list = tk.Listbox(recipe_frame, height=5, width=28,
+                                      exportselection=False)
+        self.recipe_list.pack(side=tk.LEFT, fill=tk.Y)
+        self.recipe_list.bind("<Double-Button-1>",
+                              lambda event: self.edit_operation())
+
+        buttons = ttk.Frame(recipe_frame)
+        buttons.pack(side=tk.LEFT, padx=5)
+        for text, command in (("Изменить", self.edit_operation),
+                              ("Удалить", self.remove_operation),
+                              ("Сохранить рецепт", self.save_recipe),
+                              ("Открыть рецепт", self.open_recipe)):
+            ttk.Button(buttons, text=text, command=command).pack(
+                fill=tk.X, pady=1)
+
+    def create_documents_frame(self, parent):
+        """Создание фрейма со списком открытых изображений."""
+        documents_frame = ttk.LabelFrame(parent, text="Изображения",
+                                         padding=10)
+        documents_frame.pack(side=tk.LEFT, padx=10, fill=tk.Y)
+
+        self.documents_list = tk.Listbox(documents_frame, height=4,
+                                         width=24, exportselection=False)
+        self.documents_list.pack(fill=tk.X)
+        self.documents_list.bind("<<ListboxSelect>>",
+                                 lambda event: self.switch_document())
+
+        self.memory_var = tk.StringVar(value="")
+        ttk.Label(documents_frame,
+                  textvariable=self.memory_var).pack(pady=2)
+        ttk.Button(documents_frame, text="Закрыть",
+                   command=self.close_document).pack(fill=tk.X)
+        self.bind("<Control-w>", lambda event: self.close_document())
+
     def create_image_frame(self, parent):
         """Создание фрейма для отображения изображения."""
         img_frame = ttk.LabelFrame(parent, text="Изображение",
@@ -159,41 +430,154 @@ class ImageProcessingApp(tk.Tk):
         # Настройка холста и прокрутки
         self.canvas = tk.Canvas(img_frame, bg='#333333',
                                 highlightthickness=0)
-        self.scroll_y = ttk.Scrollbar(img_frame, orient="vertical",
-                                      command=self.canvas.yview)
-        self.scroll_x = ttk.Scrollbar(img_frame, orient="horizontal",
-                                      command=self.canvas.xview)
+        self.scroll_y = ttk.Scrollbar(
+            img_frame, orient="vertical",
+            command=lambda *args: self.viewport.yview(*args))
+        self.scroll_x = ttk.Scrollbar(
+            img_frame, orient="horizontal",
+            command=lambda *args: self.viewport.xview(*args))
         self.canvas.configure(yscrollcommand=self.scroll_y.set,
                               xscrollcommand=self.scroll_x.set)
 
         self.scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
         self.scroll_x.pack(side=tk.BOTTOM, fill=tk.X)
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.canvas.bind("<Button-3>", self.select_annotation)
+        self.bind("<Delete>", lambda event: self.remove_operation())
 
     def create_status_bar(self):
         """Создание строки состояния внизу окна."""
         self.status_var = tk.StringVar(value="Готов к работе")
+        status_frame = ttk.Frame(self)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+
+        ttk.Button(
+            status_frame,
+            text="Отмена",
+            command=self.cancel_jobs
+        ).pack(side=tk.RIGHT)
+        ttk.Button(
+            status_frame,
+            text="Экспорт трассы",
+            command=self.export_trace
+        ).pack(side=tk.RIGHT)
+        self.trace_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            status_frame,
+            text="Трассировка",
+            variable=self.trace_var,
+            command=self.toggle_tracing
+        ).pack(side=tk.RIGHT, padx=5)
+        self.timing_var = tk.StringVar(value="")
+        ttk.Label(
+            status_frame,
+            textvariable=self.timing_var,
+            anchor=tk.E,
+            padding=5
+        ).pack(side=tk.RIGHT)
         status_bar = ttk.Label(
-            self,
+            status_frame,
             textvariable=self.status_var,
             relief=tk.SUNKEN,
             anchor=tk.W,
             padding=5
         )
-        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.bind("<Escape>", lambda event: self.cancel_jobs())
+
+    def on_close(self):
+        """Остановка фоновых задач и закрытие окна."""
+        self.jobs.shutdown()
+        self.background.shutdown()
+        self.exports.shutdown()
+        if "workspace" in vars(self):
+            self.workspace.shutdown()
+        if "decoder" in vars(self):
+            self.decoder.shutdown()
+        if self.camera is not None:
+            self.camera.stop()
+        self.destroy()
+
+    def toggle_tracing(self):
+        """Включение и выключение трассировки этапов."""
+        tracing.set_enabled(self.trace_var.get())
+        if not self.trace_var.get():
+            self.timing_var.set("")
+
+    def export_trace(self):
+        """Сохранение трассы в формате Chrome trace-event."""
+        if not tracing.TRACER.events:
+            messagebox.showinfo(
+                "Трассировка",
+                "Трасса пуста: включите трассировку и выполните операции"
+            )
+            return
+
+        path = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("Chrome trace", "*.json"), ("Все файлы", "*.*")]
+        )
+        if not path:
+            return
+        tracing.TRACER.export_chrome(path)
+        self.status_var.set(f"Трасса сохранена: {path}")
+
+    def show_progress(self, job, done, total):
+        """Отображение прогресса фоновой задачи в строке состояния."""
+        self.status_var.set(f"Обработка ({job.key}): {done}/{total}")
+
+    def cancel_jobs(self):
+        """Отмена всех выполняющихся фоновых задач."""
+        if self.jobs.busy or self.exports.busy:
+            self.jobs.cancel()
+            self.exports.cancel()
+            self.live_busy = False
+            self.status_var.set("Операция отменена")
 
     def check_camera(self):
-        """Проверка доступности камеры."""
-        cap = cv2.VideoCapture(0)
-        if cap is None or not cap.isOpened():
-            return False
-        cap.release()
-        return True
+        """Проверка наличия камеры без удержания устройства."""
+        return camera.probe(self.camera_source)
+
+    def open_camera(self):
+        """
+        Сеанс камеры для съемки или живого просмотра.
+
+        Устройство открывается методом start сеанса в фоновой задаче
+        и остается открытым, пока камерой пользуются.
+
+        Возвращает:
+            camera.CameraSession: Сеанс захвата
+        """
+        if self.camera_idle is not None:
+            self.after_cancel(self.camera_idle)
+            self.camera_idle = None
+        if self.camera is None:
+            self.camera = camera.CameraSession(self.camera_source)
+        return self.camera
+
+    def release_camera_later(self):
+        """Закрытие камеры, если ею не пользуются camera_timeout секунд."""
+        if self.camera_idle is not None:
+            self.after_cancel(self.camera_idle)
+            self.camera_idle = None
+        if self.camera_timeout > 0:
+            self.camera_idle = self.after(int(self.camera_timeout * 1000),
+                                          self.stop_camera)
+
+    def stop_camera(self):
+        """Освобождение камеры, если живой просмотр выключен."""
+        self.camera_idle = None
+        if self.camera is not None and not self.live_var.get():
+            self.camera.stop()
 
     def update_camera_status(self):
         """Обновление статуса камеры в интерфейсе."""
-        status = "Доступна" if self.camera_available else "Недоступна"
-        color = "green" if self.camera_available else "red"
+        if self.camera_available is None:
+            status, color = "проверка...", "gray"
+        elif self.camera_available:
+            status, color = "Доступна", "green"
+        else:
+            status, color = "Недоступна", "red"
         self.camera_status.config(text=f"Камера: {status}",
                                   foreground=color)
         self.camera_btn.config(
@@ -209,31 +593,104 @@ class ImageProcessingApp(tk.Tk):
         path = filedialog.askopenfilename(filetypes=filetypes)
         if not path:
             return
+        self.open_file(path)
+
+    def set_current_path(self, path):
+        """Запоминание текущего файла и его места в папке."""
+        folder = os.path.dirname(path)
+        if not self.folder_files or \
+                os.path.dirname(self.folder_files[0]) != folder:
+            self.folder_files = decode_cache.list_images(folder)
+        self.file_index = self.folder_files.index(path) \
+            if path in self.folder_files else None
+        self.current_path = path
+
+    def open_file(self, path, replace=False):
+        """
+        Открытие файла: сначала быстрый уменьшенный предпросмотр, затем
+        полное декодирование; соседние файлы папки подгружаются в фоне.
 
-        try:
-            # Используем raw-строку для пути и проверяем доступность файла
-            image = cv2.imread(r'{}'.format(path))
-            if image is None:
+        Уже открытый файл просто становится активным документом.
+
+        Аргументы:
+            path (str): Путь к изображению
+            replace (bool): Заменить активный документ, а не открыть
+                новый
+        """
+        path = os.path.abspath(path)
+        document = self.workspace.find(path)
+        if document is not None:
+            self.show_document(document, f"Изображение: {path}")
+            return
+        self.set_current_path(path)
+
+        def preview(job):
+            """Уменьшенное декодирование для мгновенного показа."""
+            return self.decoder.decode_preview(path, PREVIEW_SIZE)
+
+        def show_preview(image):
+            """Показ предпросмотра, пока не готово полное изображение."""
+            if self.current_path == path and self.jobs.busy:
+                self.shown = None
+                self.viewport.set_image(image, image.shape)
+
+        def decode(job):
+            """Декодирование и подготовка изображения в фоне."""
+            try:
+                image = self.decoder.decode(path)
+            except (OSError, ValueError) as e:
                 raise ValueError(
                     "Не удалось загрузить изображение. Проверьте:\n"
                     "1. Корректность пути к файлу\n"
                     "2. Поддерживаемый формат (JPEG, PNG)\n"
                     "3. Отсутствие кириллицы в пути"
-                )
+                ) from e
+            job.check()
+            return image, graph.OperationGraph.prepare_source(
+                image, decode_cache.file_key(path))
 
-            # Конвертация цветового пространства
-            self.original_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            self.current_image = self.original_image.copy()
-            self._update_image_display()
-            self.status_var.set(f"Успешно загружено: {path}")
-
-        except Exception as e:
+        def failed(error):
+            """Обработка ошибки загрузки в главном потоке."""
             messagebox.showerror(
                 "Ошибка загрузки",
-                str(e)
+                str(error)
             )
             # Логирование ошибки для диагностики
-            print(f"Ошибка при загрузке {path}: {str(e)}")
+            print(f"Ошибка при загрузке {path}: {str(error)}")
+
+        self.live_var.set(False)
+        self.status_var.set(f"Загрузка: {path}")
+        self.jobs.submit("preview", preview, on_done=show_preview)
+        self.jobs.submit(
+            "load", decode,
+            on_done=lambda result: self.set_source_image(
+                *result, message=f"Успешно загружено: {path}", path=path,
+                replace=replace),
+            on_error=failed
+        )
+
+        # Соседние файлы - в порядке вероятного перехода
+        if self.file_index is not None:
+            neighbours = []
+            for offset in range(1, decode_cache.PREFETCH_RADIUS + 1):
+                for index in (self.file_index + offset,
+                              self.file_index - offset):
+                    if 0 <= index < len(self.folder_files):
+                        neighbours.append(self.folder_files[index])
+            self.decoder.prefetch(neighbours, PREVIEW_SIZE)
+
+    def navigate(self, step):
+        """
+        Переход к соседнему изображению папки.
+
+        Аргументы:
+            step (int): -1 - предыдущее, 1 - следующее
+        """
+        if self.file_index is None:
+            return
+        index = self.file_index + step
+        if 0 <= index < len(self.folder_files):
+            self.open_file(self.folder_files[index], replace=True)
 
     def capture_from_camera(self):
         """Захват изображения с камеры."""
@@ -244,97 +701,565 @@ class ImageProcessingApp(tk.Tk):
             )
             return
 
-        cap = cv2.VideoCapture(0)
-        ret, frame = cap.read()
-        cap.release()
+        session = self.open_camera()
+
+        def capture(job):
+            """Открытие камеры и снимок из буфера сеанса в фоне."""
+            if not session.start():
+                raise ValueError("Не удалось открыть камеру")
+            image = session.snapshot()
+            if image is None:
+                raise ValueError("Не удалось получить изображение с камеры")
+            job.check()
+            return image, graph.OperationGraph.prepare_source(image)
+
+        def done(result):
+            """Открытие снимка как нового документа."""
+            self.release_camera_later()
+            self.set_source_image(
+                *result, message="Изображение с камеры захвачено",
+                title=time.strftime("Снимок %H:%M:%S"))
+
+        def failed(error):
+            """Сообщение об ошибке съемки."""
+            self.release_camera_later()
+            messagebox.showerror("Ошибка", str(error))
+
+        self.live_var.set(False)
+        self.status_var.set("Съемка...")
+        self.jobs.submit("load", capture, on_done=done, on_error=failed)
+
+    def set_source_image(self, image, prepared=None, message=None,
+                         path=None, title=None, replace=False):
+        """
+        Открытие нового документа с пустой цепочкой.
+
+        Аргументы:
+            image (np.ndarray): Исходное RGB-изображение
+            prepared (tuple): Результат OperationGraph.prepare_source
+            message (str): Сообщение для строки состояния
+            path (str): Путь к файлу изображения или None
+            title (str): Название документа (по умолчанию - имя файла)
+            replace (bool): Заменить активный документ, а не добавить
+        """
+        key, levels = prepared if prepared is not None else (None, None)
+        source = graph.OperationGraph(self.graph.cache)
+        source.set_source(image, key, levels)
+        overlay = annotations.LineLayer()
+        if title is None:
+            title = os.path.basename(path) if path else "Без имени"
+        document = workspace.Document(
+            title, source, overlay, history.History(source, overlay), path)
+        self.workspace.add(
+            document, replace=self.workspace.active if replace else None)
+        self.show_document(document, message)
+
+    def show_document(self, document, message=None):
+        """
+        Переключение просмотра и правки на документ.
+
+        Аргументы:
+            document (workspace.Document): Открытый документ
+            message (str): Сообщение для строки состояния
+        """
+        self.workspace.activate(document)
+        self.graph = document.graph
+        self.overlay = document.overlay
+        self.history = document.history
+        self.original_image = document.graph.source
+        if document.path is not None:
+            self.set_current_path(document.path)
+        self.composite = None
+        self.shown = None
+        self.sync_channel()
+        self.viewport.reset(self.original_image.shape)
+        self.refresh_documents()
+        self.refresh_image(message or f"Изображение: {document.title}")
+        self.spill_idle()
+
+    def switch_document(self):
+        """Показ документа, выбранного в списке изображений."""
+        selection = self.documents_list.curselection()
+        if not selection:
+            return
+        document = self.workspace.documents[selection[0]]
+        if document is not self.workspace.active:
+            self.show_document(document)
+
+    def close_document(self):
+        """Закрытие активного документа."""
+        document = self.workspace.active
+        if document is None:
+            return
+        following = self.workspace.close(document)
+        # Результаты закрытого документа уже не нужны
+        self.jobs.cancel("render")
+        self.jobs.cancel("preview")
+        if following is not None:
+            self.show_document(following, f"Закрыто: {document.title}")
+            return
+
+        # Последний документ: пустая цепочка без изображения
+        self.graph = graph.OperationGraph(self.graph.cache)
+        self.overlay = annotations.LineLayer()
+        self.history = history.History(self.graph, self.overlay)
+        self.original_image = None
+        self.composite = None
+        self.shown = None
+        self.current_path = None
+        self.file_index = None
+        self.channel_var.set("Все")
+        self.viewport.remove_image()
+        self.refresh_documents()
+        self.refresh_image()
+        self.status_var.set(f"Закрыто: {document.title}")
+
+    def refresh_documents(self):
+        """Обновление списка изображений и занятой ими памяти."""
+        self.documents_list.delete(0, tk.END)
+        for index, document in enumerate(self.workspace.documents):
+            self.documents_list.insert(
+                tk.END, document.title + (" (диск)" if document.spilled
+                                          else ""))
+            if document is self.workspace.active:
+                self.documents_list.selection_set(index)
+        self.memory_var.set(
+            f"В памяти {self.workspace.resident / 1024 ** 2:.0f} из "
+            f"{self.workspace.budget / 1024 ** 2:.0f} МБ")
+
+    def spill_idle(self):
+        """Выгрузка на диск давно не просмотренных документов сверх
+        бюджета памяти в фоне."""
+        def spilled(document):
+            """Освобождение полного декодирования выгруженного файла."""
+            # Исходное изображение документа - тот же массив, что в кэше
+            # декодирования, иначе выгрузка не освободила бы память
+            if document.path is not None:
+                self.decoder.discard(document.graph.source_key)
+            self.refresh_documents()
+
+        for document in self.workspace.to_spill():
+            self.background.submit(
+                f"spill:{document.id}",
+                lambda job, document=document: self.workspace.spill(
+                    document),
+                on_done=lambda freed, document=document: spilled(document),
+                on_error=lambda error: self.status_var.set(
+                    f"Не удалось выгрузить изображение: {error}")
+            )
+
+    @staticmethod
+    def full_result(source, nodes, overlay, progress=None):
+        """
+        Результат цепочки в полном разрешении с линиями слоя.
+
+        Цепочка кэшируется графом операций; линии растеризуются поверх
+        нее на копии. Может вызываться из фонового потока.
+
+        Аргументы:
+            source (graph.OperationGraph): Цепочка с исходным изображением
+            nodes (list): Снимок узлов цепочки
+            overlay (annotations.LineLayer): Снимок слоя линий
+            progress (callable): Функция progress(готово, всего) или None
+
+        Возвращает:
+            np.ndarray: RGB-изображение или None
+        """
+        image = source.result(progress=progress, nodes=nodes)
+        if image is None or not len(overlay):
+            return image
+        return overlay.rasterize(image)
+
+    def refresh_image(self, message=None):
+        """
+        Пересчет цепочки операций в фоне и обновление отображения.
+
+        Повторные вызовы до завершения пересчета вытесняют предыдущий,
+        так что выполняется только последний.
+
+        Аргументы:
+            message (str): Сообщение для строки состояния по готовности
+        """
+        self.recipe_list.delete(0, tk.END)
+        for name, params in self.graph.nodes:
+            self.recipe_list.insert(
+                tk.END, operations.format_recipe([(name, params)]))
+        for line in self.overlay.to_recipe():
+            self.recipe_list.insert(tk.END, operations.format_recipe([line]))
+        self.update_history_buttons()
+        self.render_view(message)
+
+    def update_history_buttons(self):
+        """Доступность кнопок отмены и повтора по истории документа."""
+        self.undo_btn.config(
+            state=tk.NORMAL if self.history.can_undo else tk.DISABLED)
+        self.redo_btn.config(
+            state=tk.NORMAL if self.history.can_redo else tk.DISABLED)
+
+    def render_view(self, message=None):
+        """
+        Вычисление цепочки на уровне пирамиды, достаточном для текущего
+        масштаба, и обновление холста.
+
+        Линии слоя рисуются поверх результата цепочки на том же уровне.
+        Если результат цепочки не изменился, линии перерисовываются на
+        месте только в областях правки, а на холсте обновляются только
+        тайлы, которых коснулась правка.
+
+        Аргументы:
+            message (str): Сообщение для строки состояния по готовности
+        """
+        if self.original_image is None:
+            return
+
+        source = self.graph
+        level = source.preview_level(self.viewport.target_size())
+        source_key, recipe = source.source_key, list(source.nodes)
+        overlay = self.overlay.copy()
+        lines = overlay.to_recipe()
+        scale = source.level_scale(level)
+
+        def render(job):
+            """Вычисление цепочки на выбранном уровне."""
+            with tracing.span("render", level=level) as span:
+                image = span.record(source.result(
+                    level=level, progress=job.report, nodes=recipe))
+            composite = self.composite
+            if not lines or composite is not None and \
+                    composite[0] is image:
+                return image, None
+            # Новый результат цепочки: слой рисуется на копии целиком
+            with tracing.span("annotations", count=len(lines)):
+                return image, overlay.rasterize(image, scale)
+
+        def done(result):
+            """Отображение результата в главном потоке."""
+            if source_key != self.graph.source_key:
+                return  # Документ закрыт или сменился
+            image, composed = result
+            if not lines:
+                self.composite = None
+            elif composed is not None:
+                self.composite = (image, composed, lines)
+            else:
+                # Показанное изображение со слоем меняется только здесь,
+                # в главном потоке, вместе со сбросом его тайлов
+                composite = self.composite
+                with tracing.span("annotations", count=len(lines)):
+                    if composite is not None and composite[0] is image:
+                        composed = overlay.rasterize(
+                            image, scale, dst=composite[1],
+                            regions=operations.changed_region(
+                                composite[2], lines))
+                    else:
+                        composed = overlay.rasterize(image, scale)
+                self.composite = (image, composed, lines)
+
+            dirty = None
+            if self.shown is not None and self.shown[0] == source_key:
+                dirty = operations.changed_region(self.shown[1],
+                                                  recipe + lines)
+            self.shown, self.shown_level = (source_key, recipe + lines), level
+            self.viewport.set_image(
+                image if self.composite is None else self.composite[1],
+                self.original_image.shape, dirty)
+            self.show_timing()
+            if message:
+                self.status_var.set(message)
+
+        self.jobs.submit(
+            "render", render, on_done=done,
+            on_error=lambda error: messagebox.showerror("Ошибка", str(error))
+        )
+
+    def on_zoom(self, zoom):
+        """Пересчет на другом уровне пирамиды, если текущего уровня
+        недостаточно или он избыточен для нового масштаба."""
+        self.zoom_var.set(f"{zoom * 100:.0f}%")
+        # На холсте кадр камеры или предпросмотр загружаемого файла
+        if self.shown is None:
+            return
+        if self.graph.preview_level(self.viewport.target_size()) != \
+                self.shown_level:
+            self.render_view()
+
+    def toggle_live_preview(self):
+        """Включение и выключение живого просмотра с камеры."""
+        if self.live_var.get():
+            if not self.camera_available:
+                self.live_var.set(False)
+                messagebox.showerror("Ошибка камеры", "Веб-камера недоступна")
+                return
+            session = self.open_camera()
+
+            def failed(error):
+                """Выключение просмотра, если камера не открылась."""
+                self.live_var.set(False)
+                self.release_camera_later()
+                messagebox.showerror("Ошибка камеры", str(error))
+
+            def start(job):
+                """Открытие камеры в фоне."""
+                if not session.start():
+                    raise ValueError("Не удалось открыть камеру")
+
+            self.jobs.submit("camera", start, on_error=failed)
+            self.status_var.set("Живой просмотр")
+            self.update_live_preview()
+        else:
+            self.jobs.cancel("live")
+            self.live_busy = False
+            self.release_camera_later()
+            self.refresh_image("Живой просмотр остановлен")
+
+    def update_live_preview(self):
+        """
+        Обработка последнего кадра камеры текущим рецептом.
+
+        Вызывается с целевой частотой LIVE_FPS. Пока предыдущий кадр
+        обрабатывается, новые кадры пропускаются, а не копятся.
+        """
+        if not self.live_var.get():
+            return
+        self.after(1000 // LIVE_FPS, self.update_live_preview)
+        if self.live_busy:
+            return
 
-        if not ret:
+        index, frame = self.camera.latest(newer_than=self.live_frame)
+        if frame is None:
+            return
+        self.live_frame = index
+        self.live_busy = True
+        recipe = list(self.graph.nodes)
+        overlay = self.overlay.copy()
+
+        def process(job):
+            """Уменьшение кадра и применение рецепта в фоне."""
+            with tracing.span("live", frame=index) as span:
+                height, width = frame.shape[:2]
+                scale = min(1, PREVIEW_SIZE / max(height, width))
+                small = cv2.resize(
+                    frame, (int(width * scale), int(height * scale)),
+                    interpolation=cv2.INTER_AREA
+                ) if scale < 1 else frame
+                # Уменьшенная копия своя, ее можно менять на месте; кадр
+                # из буфера камеры - нельзя
+                small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB,
+                                     dst=small if scale < 1 else None)
+                job.check()
+                result = fusion.apply_recipe(small, [
+                    (name, operations.scale_params(name, params, scale))
+                    for name, params in recipe
+                ], dst=small)
+                return span.record(
+                    overlay.rasterize(result, scale, dst=result))
+
+        def done(result):
+            """Показ обработанного кадра."""
+            self.live_busy = False
+            if self.live_var.get():
+                self.shown = None
+                self.viewport.set_image(result, result.shape)
+                self.show_timing()
+
+        def failed(error):
+            """Остановка просмотра при ошибке обработки."""
+            self.live_busy = False
+            self.live_var.set(False)
+            messagebox.showerror("Ошибка", str(error))
+
+        self.jobs.submit("live", process, on_done=done, on_error=failed)
+
+    def show_timing(self):
+        """Показ длительностей этапов в строке состояния."""
+        if tracing.TRACER.enabled:
+            self.timing_var.set(tracing.TRACER.summary(TIMING_STAGES))
+
+    def export_dialog(self):
+        """Выбор файла и параметров сжатия для экспорта результата."""
+        if self.original_image is None:
             messagebox.showerror(
                 "Ошибка",
-                "Не удалось получить изображение с камеры"
+                "Сначала загрузите изображение"
             )
             return
 
-        self.original_image = cv2.cvtColor(
-            frame, cv2.COLOR_BGR2RGB)
-        self.current_image = self.original_image.copy()
-        self.channel_var.set("Все")
-        self.show_image()
-        self.status_var.set("Изображение с камеры захвачено")
-
-    def show_image(self):
-        """Отображение текущего изображения на холсте."""
-        if self.current_image is None:
+        path = filedialog.asksaveasfilename(
+            defaultextension=".png",
+            filetypes=[("PNG", "*.png"), ("JPEG", "*.jpg *.jpeg"),
+                       ("WebP", "*.webp")]
+        )
+        if not path:
+            return
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in export.FORMATS:
+            messagebox.showerror(
+                "Ошибка",
+                "Поддерживаются форматы PNG, JPEG и WebP"
+            )
             return
 
+        dialog = tk.Toplevel(self)
+        dialog.title(f"Параметры {export.FORMATS[extension]}")
+        dialog.resizable(False, False)
+        dialog.grab_set()
+
+        quality_var = tk.StringVar(value=str(export.DEFAULT_QUALITY))
+        compression_var = tk.StringVar(value=str(export.DEFAULT_COMPRESSION))
+        progressive_var = tk.BooleanVar(value=False)
+        optimize_var = tk.BooleanVar(value=False)
+
+        if extension == ".png":
+            ttk.Label(dialog, text="Уровень сжатия (0-9)").grid(row=0,
+                                                                column=0)
+            ttk.Entry(dialog, textvariable=compression_var,
+                      width=8).grid(row=0, column=1)
+        else:
+            ttk.Label(dialog, text="Качество (1-100)").grid(row=0, column=0)
+            ttk.Entry(dialog, textvariable=quality_var,
+                      width=8).grid(row=0, column=1)
+        if export.FORMATS[extension] == "JPEG":
+            ttk.Checkbutton(dialog, text="Прогрессивный",
+                            variable=progressive_var).grid(
+                                row=1, columnspan=2, sticky=tk.W)
+            ttk.Checkbutton(dialog, text="Оптимизировать",
+                            variable=optimize_var).grid(
+                                row=2, columnspan=2, sticky=tk.W)
+
+        def apply():
+            """Обработка нажатия кнопки Сохранить."""
+            try:
+                options = {
+                    "quality": int(quality_var.get()),
+                    "compression": int(compression_var.get()),
+                    "progressive": progressive_var.get(),
+                    "optimize": optimize_var.get(),
+                }
+                export.encode_params(extension, **options)
+            except ValueError as e:
+                messagebox.showerror("Ошибка", f"Некорректные параметры: {e}")
+                return
+            dialog.destroy()
+            self.export_result(path, **options)
+
+        ttk.Button(dialog, text="Сохранить", command=apply).grid(
+            row=3, columnspan=2, pady=10)
+
+    def export_result(self, path, **options):
+        """
+        Экспорт результата в полном разрешении в фоне.
 
-        img = self.current_image.copy()
-        height, width = img.shape[:2]
-        max_size = 800
+        Цепочка и слой линий фиксируются в момент вызова, так что
+        дальнейшие правки не влияют на уже запущенный экспорт.
+        Экспорты в разные файлы кодируются параллельно.
 
-        if max(height, width) > max_size:
-            scale = max_size / max(height, width)
-            new_w, new_h = int(width * scale), int(height * scale)
-            img = cv2.resize(
-                img, (new_w, new_h),
-                interpolation=cv2.INTER_AREA
+        Аргументы:
+            path (str): Путь к файлу (формат - по расширению)
+            **options: Параметры export.encode_params
+        """
+        source, nodes = self.graph, list(self.graph.nodes)
+        overlay = self.overlay.copy()
+
+        def run(job):
+            """Вычисление результата и кодирование в фоне."""
+            image = self.full_result(source, nodes, overlay, job.report)
+            job.check()
+            with tracing.span("encode", path=path):
+                return export.export_image(image, path, **options)
+
+        def done(result):
+            """Отчет о времени кодирования и размере файла."""
+            self.status_var.set(
+                f"Сохранено: {path} ({export.format_size(result['size'])}, "
+                f"кодирование {result['encode_time'] * 1000:.0f} мс, "
+                f"запись {result['write_time'] * 1000:.0f} мс)"
             )
+            self.show_timing()
 
-        img_pil = Image.fromarray(img)
-        self.photo_image = ImageTk.PhotoImage(img_pil)
+        self.status_var.set(f"Экспорт: {path}")
+        self.exports.submit(
+            f"export:{path}", run, on_done=done,
+            on_error=lambda error: messagebox.showerror(
+                "Ошибка экспорта", str(error))
+        )
 
-        self.canvas.delete("all")
-        self.canvas.create_image(0, 0, anchor="nw",
-                                 image=self.photo_image)
-        self.canvas.config(scrollregion=self.canvas.bbox("all"))
+    def process_video_dialog(self):
+        """Обработка видеофайла текущим рецептом в фоне."""
+        input_path = filedialog.askopenfilename(
+            filetypes=[("Видео", "*.mp4 *.avi *.mov *.mkv *.m4v"),
+                       ("Все файлы", "*.*")]
+        )
+        if not input_path:
+            return
+        output_path = filedialog.asksaveasfilename(
+            defaultextension=".mp4",
+            filetypes=[("MP4", "*.mp4"), ("AVI", "*.avi")]
+        )
+        if not output_path:
+            return
+
+        # Линии слоя рисуются в координатах кадра после всей цепочки
+        recipe = list(self.graph.nodes) + self.overlay.to_recipe()
+
+        def run(job):
+            """Конвейер обработки видео в фоне."""
+            return video.process_video(
+                input_path, recipe, output_path,
+                progress=lambda stats: job.report(stats.written,
+                                                  stats.total or 0))
+
+        self.status_var.set(f"Обработка видео: {input_path}")
+        self.exports.submit(
+            f"video:{output_path}", run,
+            on_done=lambda stats: self.status_var.set(
+                f"Видео сохранено: {output_path} ({stats.summary()})"),
+            on_error=lambda error: messagebox.showerror(
+                "Ошибка обработки видео", str(error))
+        )
 
     def reset_image(self):
         """Сброс изображения к исходному состоянию."""
         if self.original_image is not None:
-            self.current_image = self.original_image.copy()
+            # Сброс меняет все сразу, поэтому для отмены сохраняется
+            # сжатый снимок цепочки и слоя
+            before = self.history.snapshot()
+            self.graph.clear()
+            self.overlay.clear()
+            self.history.record_checkpoint("сброс изменений", before)
             self.channel_var.set("Все")
-            self.show_image()
-            self.status_var.set("Изображение сброшено к оригиналу")
+            self.refresh_image("Изображение сброшено к оригиналу")
 
     def apply_channel(self):
         """Применение выбранного цветового канала."""
         if self.original_image is None:
             return
 
+        # Канал выбирается для исходного изображения, поэтому его узел
+        # всегда первый в цепочке и последующие правки сохраняются
         channel = self.channel_var.get()
-
-        if channel == "Все":
-            self.current_image = self.original_image.copy()
+        index = self.graph.find("channel")
+        params = {"channel": operations.CHANNEL_BY_LABEL[channel]}
+        before = list(self.graph.nodes)
+
+        if params["channel"] == "all":
+            if index is not None:
+                self.graph.remove(index)
+        elif index is not None:
+            self.graph.update(index, params)
         else:
-            b, g, r = cv2.split(
-                cv2.cvtColor(
-                    self.original_image,
-                    cv2.COLOR_RGB2BGR
-                )
-            )
-            zeros = np.zeros_like(b)
-
-            if channel == "Красный":
-                self.current_image = cv2.merge(
-                    [zeros, zeros, r])
-            elif channel == "Зеленый":
-                self.current_image = cv2.merge(
-                    [zeros, g, zeros])
-            elif channel == "Синий":
-                self.current_image = cv2.merge(
-                    [b, zeros, zeros])
-
-            self.current_image = cv2.cvtColor(
-                self.current_image,
-                cv2.COLOR_BGR2RGB
-            )
+            self.graph.insert(0, "channel", params)
+        self.history.record_nodes(f"канал {channel}", before)
+
+        self.refresh_image(f"Применен канал: {channel}")
 
-        self.show_image()
-        self.status_var.set(f"Применен канал: {channel}")
+    def adjust_brightness_dialog(self, index=None):
+        """
+        Диалог настройки яркости.
 
-    def adjust_brightness_dialog(self):
-        """Диалог настройки яркости."""
-        if self.current_image is None:
+        Аргументы:
+            index (int): Индекс изменяемого узла цепочки или None
+        """
+        if self.original_image is None:
             messagebox.showerror(
                 "Ошибка",
                 "Сначала загрузите изображение"
@@ -351,7 +1276,8 @@ class ImageProcessingApp(tk.Tk):
             text="Значение увеличения яркости (0-100):"
         ).pack(pady=5)
 
-        value_var = tk.StringVar(value="30")
+        value = 30 if index is None else self.graph.nodes[index][1]["value"]
+        value_var = tk.StringVar(value=str(value))
         ttk.Entry(dialog, textvariable=value_var, width=10).pack(pady=5)
 
         def apply():
@@ -360,7 +1286,7 @@ class ImageProcessingApp(tk.Tk):
                 value = int(value_var.get())
                 if not 0 <= value <= 100:
                     raise ValueError
-                self.adjust_brightness(value)
+                self.adjust_brightness(value, index)
                 dialog.destroy()
             except ValueError:
                 messagebox.showerror(
@@ -370,49 +1296,45 @@ class ImageProcessingApp(tk.Tk):
 
         ttk.Button(dialog, text="Применить", command=apply).pack(pady=10)
 
-    def adjust_brightness(self, value):
-        """Регулировка яркости изображения."""
-        hsv = cv2.cvtColor(
-            self.current_image,
-            cv2.COLOR_RGB2HSV
-        )
-        hue, sat, val = cv2.split(hsv)
-
-        lim = 255 - value
-        val[val > lim] = 255
-        val[val <= lim] += value
+    def adjust_brightness(self, value, index=None):
+        """
+        Регулировка яркости изображения.
 
-        final_hsv = cv2.merge((hue, sat, val))
-        self.current_image = cv2.cvtColor(
-            final_hsv,
-            cv2.COLOR_HSV2RGB
-        )
-        self.show_image()
-        self.status_var.set(f"Яркость увеличена на {value}")
+        Аргументы:
+            value (int): Значение увеличения яркости
+            index (int): Индекс изменяемого узла цепочки или None
+        """
+        before = list(self.graph.nodes)
+        if index is None:
+            self.graph.append("brightness", {"value": value})
+        else:
+            self.graph.update(index, {"value": value})
+        self.history.record_nodes("яркость", before)
+        self.refresh_image(f"Яркость увеличена на {value}")
 
     def convert_to_grayscale(self):
         """Преобразование изображения в оттенки серого."""
-        if self.current_image is None:
+        if self.original_image is None:
             messagebox.showerror(
                 "Ошибка",
                 "Сначала загрузите изображение"
             )
             return
 
-        gray = cv2.cvtColor(
-            self.current_image,
-            cv2.COLOR_RGB2GRAY
-        )
-        self.current_image = cv2.cvtColor(
-            gray,
-            cv2.COLOR_GRAY2RGB
-        )
-        self.show_image()
-        self.status_var.set("Изображение преобразовано в оттенки серого")
+        before = list(self.graph.nodes)
+        self.graph.append("grayscale", {})
+        self.history.record_nodes("оттенки серого", before)
+        self.refresh_image("Изображение преобразовано в оттенки серого")
 
-    def draw_line_dialog(self):
-        """Диалог для задания параметров линии."""
-        if self.current_image is None:
+    def draw_line_dialog(self, index=None):
+        """
+        Диалог для задания параметров линии.
+
+        Аргументы:
+            index (int): Позиция изменяемой линии в списке рецепта или
+                None
+        """
+        if self.original_image is None:
             messagebox.showerror(
                 "Ошибка",
                 "Сначала загрузите изображение"
@@ -424,8 +1346,8 @@ class ImageProcessingApp(tk.Tk):
         dialog.resizable(False, False)
         dialog.grab_set()
 
-        width = self.current_image.shape[1]
-        height = self.current_image.shape[0]
+        width = self.original_image.shape[1]
+        height = self.original_image.shape[0]
 
         ttk.Label(
             dialog,
@@ -462,6 +1384,15 @@ class ImageProcessingApp(tk.Tk):
         thickness_entry = ttk.Entry(dialog, width=8)
         thickness_entry.grid(row=4, column=1)
 
+        if index is not None:
+            line_id = self.annotation_at(index)
+            params = self.graph.nodes[index][1] if line_id is None \
+                else self.overlay.get(line_id)
+            values = (*params["start"], *params["end"], params["thickness"])
+            for entry, value in zip((x1_entry, y1_entry, x2_entry,
+                                     y2_entry, thickness_entry), values):
+                entry.insert(0, str(value))
+
         def apply():
             """Обработка нажатия кнопки Нарисовать."""
             try:
@@ -477,7 +1408,7 @@ class ImageProcessingApp(tk.Tk):
                         1 <= thickness <= 20):
                     raise ValueError
 
-                self.draw_line(x1, y1, x2, y2, thickness)
+                self.draw_line(x1, y1, x2, y2, thickness, index)
                 dialog.destroy()
             except ValueError:
                 messagebox.showerror(
@@ -491,9 +1422,10 @@ class ImageProcessingApp(tk.Tk):
             command=apply
         ).grid(row=5, columnspan=2)
 
-    def draw_line(self, start_x, start_y, end_x, end_y, thickness):
+    def draw_line(self, start_x, start_y, end_x, end_y, thickness,
+                  index=None):
         """
-        Рисование линии на изображении.
+        Рисование линии в слое аннотаций поверх изображения.
 
         Аргументы:
             start_x (int): Начальная координата X
@@ -501,22 +1433,199 @@ class ImageProcessingApp(tk.Tk):
             end_x (int): Конечная координата X
             end_y (int): Конечная координата Y
             thickness (int): Толщина линии
+            index (int): Позиция изменяемой линии в списке рецепта или
+                None
         """
-        img = self.current_image.copy()
-        cv2.line(
-            img,
-            (start_x, start_y),
-            (end_x, end_y),
-            (0, 255, 0),
-            thickness
-        )
-        self.current_image = img
-        self.show_image()
-        self.status_var.set(
+        start, end = (start_x, start_y), (end_x, end_y)
+        line_id = None if index is None else self.annotation_at(index)
+        if index is None:
+            line_id = self.overlay.add(start, end, thickness)
+            self.history.record_line_add("линия", line_id)
+        elif line_id is not None:
+            before = self.overlay.get(line_id)
+            self.overlay.update(line_id, start, end, thickness)
+            self.history.record_line_update("линия", line_id, before)
+        else:
+            # Линия из открытого рецепта перед поточечными операциями
+            before = list(self.graph.nodes)
+            self.graph.update(index, {"start": start, "end": end,
+                                      "thickness": thickness})
+            self.history.record_nodes("линия", before)
+        self.refresh_image(
             f"Нарисована линия: ({start_x},{start_y})-({end_x},{end_y})"
         )
 
+    def selected_operation(self):
+        """Позиция выбранной в списке операции или None."""
+        selection = self.recipe_list.curselection()
+        return selection[0] if selection else None
+
+    def annotation_at(self, index):
+        """
+        Идентификатор линии слоя по позиции в списке рецепта.
+
+        Список содержит сначала узлы цепочки, затем линии слоя.
+
+        Аргументы:
+            index (int): Позиция в списке
+
+        Возвращает:
+            int: Идентификатор линии или None для узла цепочки
+        """
+        offset = index - len(self.graph.nodes)
+        return self.overlay.ids[offset] if offset >= 0 else None
+
+    def select_annotation(self, event):
+        """Выбор в списке рецепта линии под курсором (правая кнопка)."""
+        if self.original_image is None or not len(self.overlay):
+            return
+
+        zoom = self.viewport.zoom
+        line_id = self.overlay.hit_test(self.canvas.canvasx(event.x) / zoom,
+                                        self.canvas.canvasy(event.y) / zoom,
+                                        HIT_TOLERANCE / zoom)
+        self.recipe_list.selection_clear(0, tk.END)
+        if line_id is None:
+            self.status_var.set("Под курсором нет линии")
+            return
+
+        index = len(self.graph.nodes) + self.overlay.ids.index(line_id)
+        self.recipe_list.selection_set(index)
+        self.recipe_list.see(index)
+        self.status_var.set("Линия выбрана: Delete - удалить, "
+                            "двойной щелчок в списке - изменить")
+
+    def edit_operation(self):
+        """Изменение параметров выбранной операции цепочки."""
+        index = self.selected_operation()
+        if index is None:
+            return
+
+        name = "line" if self.annotation_at(index) is not None \
+            else self.graph.nodes[index][0]
+        if name == "brightness":
+            self.adjust_brightness_dialog(index)
+        elif name == "line":
+            self.draw_line_dialog(index)
+        else:
+            self.status_var.set("У этой операции нет параметров")
+
+    def remove_operation(self):
+        """Удаление выбранной операции из цепочки."""
+        index = self.selected_operation()
+        if index is None:
+            return
+
+        line_id = self.annotation_at(index)
+        if line_id is not None:
+            params = self.overlay.get(line_id)
+            self.overlay.remove(line_id)
+            self.history.record_line_remove("удаление линии", line_id,
+                                            params)
+            self.refresh_image("Линия удалена")
+            return
+        if self.graph.nodes[index][0] == "channel":
+            self.channel_var.set("Все")
+        before = list(self.graph.nodes)
+        self.graph.remove(index)
+        self.history.record_nodes("удаление операции", before)
+        self.refresh_image("Операция удалена из рецепта")
+
+    def save_recipe(self):
+        """Сохранение цепочки операций в текстовый файл рецепта."""
+        path = filedialog.asksaveasfilename(
+            defaultextension=".txt",
+            filetypes=[("Рецепт", "*.txt"), ("Все файлы", "*.*")]
+        )
+        if not path:
+            return
+
+        # Линии слоя рисуются после всех операций цепочки
+        lines = operations.format_recipe(self.overlay.to_recipe())
+        text = ",".join(part for part in (self.graph.to_text(), lines)
+                        if part)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+        self.status_var.set(f"Рецепт сохранен: {path}")
+
+    def open_recipe(self):
+        """Загрузка рецепта и применение его к текущему изображению."""
+        path = filedialog.askopenfilename(
+            filetypes=[("Рецепт", "*.txt"), ("Все файлы", "*.*")]
+        )
+        if not path:
+            return
+
+        before = self.history.snapshot()
+        try:
+            with open(path, encoding="utf-8") as file:
+                self.graph.load_text(file.read())
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Ошибка рецепта", str(e))
+            return
+
+        # Линии после всех остальных операций переносятся в слой;
+        # линии перед поточечными операциями остаются узлами цепочки,
+        # так как эти операции меняют их цвет
+        trailing = []
+        while self.graph.nodes and self.graph.nodes[-1][0] == "line":
+            trailing.insert(0, self.graph.nodes[-1])
+            self.graph.remove(len(self.graph.nodes) - 1)
+        self.overlay.clear()
+        for _, params in trailing:
+            self.overlay.add(params["start"], params["end"],
+                             params["thickness"],
+                             params.get("color", operations.LINE_COLOR))
+        self.history.record_checkpoint("открытие рецепта", before)
+
+        self.sync_channel()
+        self.refresh_image(f"Рецепт применен: {path}")
+
+    def sync_channel(self):
+        """Выбор в интерфейсе канала из узла channel цепочки."""
+        index = self.graph.find("channel")
+        channel = ("all" if index is None
+                   else self.graph.nodes[index][1]["channel"])
+        self.channel_var.set(operations.CHANNELS[channel])
+
+    def undo(self):
+        """Отмена последней правки цепочки или слоя линий."""
+        label = self.history.undo()
+        if label is None:
+            self.status_var.set("Нечего отменять")
+            return
+        self.sync_channel()
+        self.refresh_image(f"Отменено: {label}")
+
+    def redo(self):
+        """Повтор последней отмененной правки."""
+        label = self.history.redo()
+        if label is None:
+            self.status_var.set("Нечего повторять")
+            return
+        self.sync_channel()
+        self.refresh_image(f"Повторено: {label}")
+
 
 if __name__ == "__main__":
-    app = ImageProcessingApp()
+    parser = argparse.ArgumentParser(description="Image Processor PRO")
+    parser.add_argument(
+        "--camera", default="0",
+        help="Номер камеры, путь к видеофайлу или synthetic"
+    )
+    parser.add_argument(
+        "--startup-time", action="store_true",
+        help="Вывести время появления окна, загрузки модулей и проверки "
+             "камеры, затем выйти"
+    )
+    parser.add_argument(
+        "--camera-idle", type=float, default=CAMERA_IDLE,
+        help="Через сколько секунд без съемки закрывать камеру "
+             f"(0 - не закрывать, по умолчанию {CAMERA_IDLE})"
+    )
+    args = parser.parse_args()
+
+    app = ImageProcessingApp(camera_source=args.camera,
+                             startup_report=args.startup_time,
+                             camera_idle=args.camera_idle)
     app.mainloop()
@@ -0,0 +1,166 @@
+"""
+Пакетная обработка изображений без графического интерфейса.
+
+Применяет рецепт операций ко всем изображениям каталога (или маски)
+и распределяет работу по пулу процессов.
+
+Пример:
+    python -m batch photos/ "channel=red,brightness=30,grayscale" out/
+    python -m batch "photos/*.jpg" grayscale out/ --workers 8 --chunksize 16
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2  # pylint: disable=import-error
+
+import buffers
+import fusion
+import operations
+from decode_cache import IMAGE_EXTENSIONS
+
+# Пул промежуточных буферов рабочего процесса: файлы одного размера
+# обрабатываются без новых выделений памяти
+_POOL = buffers.BufferPool()
+
+
+def collect_inputs(source):
+    """
+    Сбор списка входных файлов.
+
+    Аргументы:
+        source (str): Каталог или маска glob
+
+    Возвращает:
+        list: Отсортированный список путей к изображениям
+    """
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source)
+    return sorted(
+        path for path in paths
+        if os.path.isfile(path)
+        and path.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def process_file(path, recipe, output_dir):
+    """
+    Обработка одного файла в рабочем процессе.
+
+    Аргументы:
+        path (str): Путь к входному изображению
+        recipe (list): Разобранный рецепт
+        output_dir (str): Каталог для результатов
+
+    Возвращает:
+        tuple: (путь, текст ошибки или None)
+    """
+    image = cv2.imread(path)
+    if image is None:
+        return path, "не удалось прочитать изображение"
+
+    # Весь рецепт выполняется на месте в буфере декодированного файла
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+    result = fusion.apply_recipe(rgb, recipe, dst=rgb, pool=_POOL)
+    out_path = os.path.join(output_dir, os.path.basename(path))
+    if not cv2.imwrite(out_path, cv2.cvtColor(result, cv2.COLOR_RGB2BGR,
+                                              dst=result)):
+        return path, "не удалось сохранить результат"
+    return path, None
+
+
+def _process_chunk(args):
+    """Обработка пачки файлов; одна задача пула на пачку."""
+    paths, recipe, output_dir = args
+    results = []
+    for path in paths:
+        try:
+            results.append(process_file(path, recipe, output_dir))
+        except Exception as e:  # pylint: disable=broad-except
+            results.append((path, str(e)))
+    return results
+
+
+def run_batch(paths, recipe, output_dir, workers=None, chunksize=8):
+    """
+    Обработка списка файлов на пуле процессов.
+
+    Аргументы:
+        paths (list): Входные файлы
+        recipe (list): Разобранный рецепт
+        output_dir (str): Каталог для результатов
+        workers (int): Число процессов (по умолчанию - число ядер)
+        chunksize (int): Число файлов в одной задаче
+
+    Возвращает:
+        list: Пары (путь, текст ошибки) для необработанных файлов
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    chunks = [
+        (paths[i:i + chunksize], recipe, output_dir)
+        for i in range(0, len(paths), chunksize)
+    ]
+    # Внутри рабочих процессов OpenCV не должен плодить свои потоки
+    workers = workers or os.cpu_count() or 1
+    failures = []
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=cv2.setNumThreads,
+                             initargs=(1,)) as pool:
+        for results in pool.map(_process_chunk, chunks):
+            failures.extend(
+                (path, error) for path, error in results if error
+            )
+    return failures
+
+
+def main(argv=None):
+    """Точка входа командной строки."""
+    parser = argparse.ArgumentParser(
+        prog="python -m batch",
+        description="Пакетная обработка изображений по рецепту"
+    )
+    parser.add_argument("input", help="Каталог или маска glob")
+    parser.add_argument(
+        "recipe",
+        help="Операции через запятую, например "
+             "channel=red,brightness=30,grayscale,line=0:0:99:99:3"
+    )
+    parser.add_argument("output", help="Каталог для результатов")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Число процессов (по умолчанию - все ядра)")
+    parser.add_argument("--chunksize", type=int, default=8,
+                        help="Число файлов в одной задаче пула")
+    args = parser.parse_args(argv)
+
+    try:
+        recipe = operations.parse_recipe(args.recipe)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.chunksize < 1:
+        parser.error("--chunksize должен быть положительным")
+
+    paths = collect_inputs(args.input)
+    if not paths:
+        print(f"Нет изображений по пути: {args.input}", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    failures = run_batch(paths, recipe, args.output,
+                         args.workers, args.chunksize)
+    elapsed = time.perf_counter() - started
+
+    for path, error in failures:
+        print(f"Ошибка при обработке {path}: {error}", file=sys.stderr)
+    done = len(paths) - len(failures)
+    print(f"Обработано {done} из {len(paths)} за {elapsed:.2f} с")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
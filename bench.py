@@ -0,0 +1,355 @@
+"""
+Набор бенчмарков для операций и пути отображения.
+
+Каждая операция измеряется на синтетических изображениях нескольких
+размеров и раскладок в памяти: время (минимум и медиана по повторам)
+и пиковый объем выделенной памяти (по tracemalloc, который учитывает
+массивы NumPy, в том числе возвращаемые OpenCV). Результаты пишутся в
+JSON и могут сравниваться с сохраненным эталоном.
+
+Пример:
+    python -m bench --sizes 0.3 12 --output bench.json
+    python -m bench --baseline bench.json --time-threshold 0.15
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2  # pylint: disable=import-error
+import numpy as np
+from PIL import Image
+
+import buffers
+import export
+import fusion
+import operations
+import viewer
+
+SIZES_MP = (0.3, 12, 48, 200)                  # Размеры, мегапиксели
+LAYOUTS = ("contiguous", "strided", "rgba_view")
+VIEW_SIZE = (1000, 700)                        # Видимая область холста
+DEFAULT_TIME_THRESHOLD = 0.10                  # Допустимый рост времени
+DEFAULT_MEMORY_THRESHOLD = 0.10                # Допустимый рост памяти
+MIN_TIME_DELTA = 0.001                         # Шум таймера, с
+
+
+def make_image(megapixels, layout="contiguous", seed=0):
+    """
+    Синтетическое RGB-изображение со сторонами 4:3.
+
+    Аргументы:
+        megapixels (float): Размер, мегапиксели
+        layout (str): Раскладка: contiguous - непрерывный массив,
+            strided - вырезка из большего массива, rgba_view - первые
+            три канала RGBA-буфера
+        seed (int): Зерно генератора
+
+    Возвращает:
+        np.ndarray: Изображение uint8 (H, W, 3)
+    """
+    width = int(math.sqrt(megapixels * 1e6 * 4 / 3))
+    height = int(megapixels * 1e6 / width)
+    rng = np.random.default_rng(seed)
+
+    # Плавный градиент с шумом: правдоподобнее для кодеков, чем шум
+    row = np.linspace(0, 255, width, dtype=np.float32)
+    noise = rng.integers(0, 32, (height, 1, 3), dtype=np.uint8)
+    if layout == "contiguous":
+        image = np.empty((height, width, 3), dtype=np.uint8)
+    elif layout == "strided":
+        image = np.empty((height + 16, width + 16, 3), dtype=np.uint8)
+        image = image[8:8 + height, 8:8 + width]
+    elif layout == "rgba_view":
+        image = np.empty((height, width, 4), dtype=np.uint8)[..., :3]
+    else:
+        raise ValueError(f"Неизвестная раскладка: {layout}")
+    image[...] = row[np.newaxis, :, np.newaxis].astype(np.uint8)
+    image += noise
+    return image
+
+
+def _display(image, photo_factory, zoom=None):
+    """
+    Путь отображения как в viewer.Viewport.render: преобразование всех
+    тайлов видимой области без кэша.
+
+    Аргументы:
+        image (np.ndarray): Отображаемое изображение
+        photo_factory (callable): ImageTk.PhotoImage или None
+        zoom (float): Масштаб (None - по размеру окна)
+    """
+    height, width = image.shape[:2]
+    view_w, view_h = VIEW_SIZE
+    if zoom is None:
+        zoom = min(1.0, view_w / width, view_h / height)
+    factor = 1 / zoom
+    size = viewer.TILE_SIZE
+    display_w = min(view_w, round(width * zoom))
+    display_h = min(view_h, round(height * zoom))
+    tiles = []
+    for y0 in range(0, display_h, size):
+        for x0 in range(0, display_w, size):
+            pil_image = Image.fromarray(viewer.tile_pixels(
+                image, factor, x0, y0, min(size, display_w - x0),
+                min(size, display_h - y0)))
+            tiles.append(photo_factory(pil_image) if photo_factory
+                         else pil_image)
+    return tiles
+
+
+def _photo_factory():
+    """Фабрика ImageTk.PhotoImage или None, если дисплея нет."""
+    try:
+        import tkinter as tk  # pylint: disable=import-outside-toplevel
+        from PIL import ImageTk  # pylint: disable=import-outside-toplevel
+        root = tk.Tk()
+        root.withdraw()
+    except Exception:  # pylint: disable=broad-except
+        return None
+    return ImageTk.PhotoImage
+
+
+def build_cases(image, path, photo_factory):
+    """
+    Измеряемые операции для одного изображения.
+
+    Аргументы:
+        image (np.ndarray): Входное изображение
+        path (str): Путь к закодированной копии (для декодирования)
+            или None
+        photo_factory (callable): ImageTk.PhotoImage или None
+
+    Возвращает:
+        dict: Имя операции -> функция без аргументов или пара
+            (подготовка, функция), если функция меняет свой буфер на
+            месте и его нужно восстанавливать перед каждым замером
+    """
+    height, width = image.shape[:2]
+    cases = {
+        "apply_channel": lambda: operations.apply_channel(image, "red"),
+        "adjust_brightness": lambda: operations.adjust_brightness(image, 30),
+        "convert_to_grayscale":
+            lambda: operations.convert_to_grayscale(image),
+        "draw_line": lambda: operations.draw_line(
+            image, (0, 0), (width - 1, height - 1), 5),
+    }
+    # Цепочка правок: с выделением памяти и на месте с пулом буферов
+    recipe = [("brightness", {"value": 30}), ("grayscale", {}),
+              ("line", {"start": (0, 0), "end": (width - 1, height - 1),
+                        "thickness": 5})]
+    work = image.copy()
+    pool = buffers.BufferPool()
+    cases["apply_recipe"] = lambda: fusion.apply_recipe(image, recipe)
+    cases["apply_recipe_in_place"] = (
+        lambda: np.copyto(work, image),
+        lambda: fusion.apply_recipe(work, recipe, dst=work, pool=pool))
+    # Слой из сотен аннотаций рисуется пакетом на месте
+    rng = np.random.default_rng(0)
+    lines = [
+        ("line", {"start": (int(x1), int(y1)), "end": (int(x2), int(y2)),
+                  "thickness": int(thickness)})
+        for x1, y1, x2, y2, thickness in zip(
+            rng.integers(0, width, 200), rng.integers(0, height, 200),
+            rng.integers(0, width, 200), rng.integers(0, height, 200),
+            rng.integers(1, 6, 200))
+    ]
+    canvas = image.copy()
+    cases["draw_lines"] = (
+        lambda: np.copyto(canvas, image),
+        lambda: fusion.apply_recipe(canvas, lines, dst=canvas))
+    # Кодирование при экспорте с настройками по умолчанию
+    cases["encode_jpeg"] = lambda: export.encode(image, ".jpg")
+    cases["encode_png"] = lambda: export.encode(image, ".png")
+    if path is not None:
+        cases["load_image"] = lambda: cv2.cvtColor(cv2.imread(path),
+                                                   cv2.COLOR_BGR2RGB)
+        cases["show_image"] = lambda: _display(image, None)
+        cases["show_image_1to1"] = lambda: _display(image, None, 1.0)
+        if photo_factory is not None:
+            cases["show_image_photo"] = \
+                lambda: _display(image, photo_factory)
+    return cases
+
+
+def measure(func, repeat, setup=None):
+    """
+    Измерение времени и пиковой памяти функции.
+
+    Время измеряется без tracemalloc, память - отдельным прогоном.
+
+    Аргументы:
+        func (callable): Измеряемая функция
+        repeat (int): Число повторов для времени
+        setup (callable): Подготовка перед каждым прогоном (не входит
+            в замер) или None
+
+    Возвращает:
+        dict: wall_min_s, wall_median_s, peak_bytes
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "wall_min_s": min(times),
+        "wall_median_s": statistics.median(times),
+        "peak_bytes": peak,
+    }
+
+
+def run_suite(sizes=SIZES_MP, layouts=LAYOUTS, repeat=3, only=None,
+              log=None):
+    """
+    Запуск всех бенчмарков.
+
+    Аргументы:
+        sizes (tuple): Размеры изображений, мегапиксели
+        layouts (tuple): Раскладки из LAYOUTS
+        repeat (int): Число повторов
+        only (set): Имена операций для запуска (None - все)
+        log (callable): Функция для вывода прогресса или None
+
+    Возвращает:
+        dict: Метаданные и результаты по ключам "операция/размер/раскладка"
+    """
+    photo_factory = _photo_factory()
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in sizes:
+            for layout in layouts:
+                image = make_image(size, layout)
+                path = None
+                # Декодирование и отображение не зависят от раскладки
+                if layout == layouts[0]:
+                    path = os.path.join(temp_dir, f"{size}.jpg")
+                    cv2.imwrite(path, image)
+                for name, case in build_cases(image, path,
+                                              photo_factory).items():
+                    if only and name not in only:
+                        continue
+                    setup, func = case if isinstance(case, tuple) \
+                        else (None, case)
+                    key = f"{name}/{size}MP/{layout}"
+                    results[key] = measure(func, repeat, setup)
+                    if log is not None:
+                        log(f"{key}: {results[key]['wall_min_s'] * 1000:.1f}"
+                            f" мс, {results[key]['peak_bytes'] / 2**20:.1f}"
+                            " МБ")
+                del image
+                if path is not None:
+                    os.remove(path)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, time_threshold=DEFAULT_TIME_THRESHOLD,
+            memory_threshold=DEFAULT_MEMORY_THRESHOLD):
+    """
+    Сравнение результатов с эталоном.
+
+    Аргументы:
+        current (dict): Результат run_suite
+        baseline (dict): Сохраненный эталон
+        time_threshold (float): Допустимый относительный рост времени
+        memory_threshold (float): Допустимый относительный рост памяти
+
+    Возвращает:
+        list: Строки с описанием регрессий
+    """
+    regressions = []
+    for key, result in current["results"].items():
+        reference = baseline["results"].get(key)
+        if reference is None:
+            continue
+        for metric, threshold in (("wall_min_s", time_threshold),
+                                  ("peak_bytes", memory_threshold)):
+            old, new = reference[metric], result[metric]
+            # Миллисекундные операции не сравниваются по шуму таймера
+            if metric == "wall_min_s" and new - old < MIN_TIME_DELTA:
+                continue
+            if old > 0 and new > old * (1 + threshold):
+                regressions.append(
+                    f"{key}: {metric} {old:.6g} -> {new:.6g} "
+                    f"(+{(new / old - 1) * 100:.1f}%)"
+                )
+    return regressions
+
+
+def main(argv=None):
+    """Точка входа командной строки."""
+    parser = argparse.ArgumentParser(
+        prog="python -m bench",
+        description="Бенчмарки операций обработки изображений"
+    )
+    parser.add_argument("--sizes", type=float, nargs="+", default=SIZES_MP,
+                        help="Размеры изображений, мегапиксели")
+    parser.add_argument("--layouts", nargs="+", default=LAYOUTS,
+                        choices=LAYOUTS, help="Раскладки в памяти")
+    parser.add_argument("--operations", nargs="+", default=None,
+                        help="Запускать только эти операции")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Число повторов каждого замера")
+    parser.add_argument("--output", default=None,
+                        help="Файл для результатов в JSON")
+    parser.add_argument("--baseline", default=None,
+                        help="Эталон в JSON для сравнения")
+    parser.add_argument("--time-threshold", type=float,
+                        default=DEFAULT_TIME_THRESHOLD,
+                        help="Допустимый рост времени (0.1 = 10%%)")
+    parser.add_argument("--memory-threshold", type=float,
+                        default=DEFAULT_MEMORY_THRESHOLD,
+                        help="Допустимый рост пиковой памяти")
+    args = parser.parse_args(argv)
+
+    current = run_suite(tuple(args.sizes), tuple(args.layouts), args.repeat,
+                        set(args.operations or ()), log=print)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(current, file, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(current, baseline, args.time_threshold,
+                              args.memory_threshold)
+        for line in regressions:
+            print(f"Регрессия: {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("Регрессий относительно эталона нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
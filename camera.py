@@ -0,0 +1,253 @@
+"""
+Постоянный сеанс захвата с камеры.
+
+Устройство открывается один раз, отдельный поток непрерывно читает
+кадры в небольшой кольцевой буфер. Снимок берется из буфера мгновенно,
+без повторного открытия устройства, а первые кадры после открытия
+(часто недоэкспонированные) пропускаются.
+
+Вместо устройства 0 можно передать путь к видеофайлу или строку
+``synthetic`` - генератор тестовых кадров, чтобы работать без камеры.
+"""
+
+import threading
+import time
+from collections import deque
+
+import cv2  # pylint: disable=import-error
+import numpy as np
+
+SYNTHETIC_SOURCE = "synthetic"
+DEFAULT_BUFFER_SIZE = 4   # Число последних кадров в буфере
+WARMUP_FRAMES = 5         # Кадры, пропускаемые после открытия устройства
+
+
+class SyntheticSource:
+    """
+    Генератор тестовых кадров с интерфейсом cv2.VideoCapture.
+
+    Кадр - цветной градиент, сдвигающийся со временем, с номером кадра.
+    """
+
+    def __init__(self, width=640, height=480, fps=30):
+        """
+        Аргументы:
+            width (int): Ширина кадра
+            height (int): Высота кадра
+            fps (float): Частота кадров
+        """
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.index = 0
+        self._opened = True
+        ys, xs = np.mgrid[0:height, 0:width]
+        self._base = ((xs * 255 // max(width - 1, 1)) ^
+                      (ys * 255 // max(height - 1, 1))).astype(np.uint8)
+
+    def isOpened(self):  # pylint: disable=invalid-name
+        """Открыт ли источник."""
+        return self._opened
+
+    def read(self):
+        """Следующий кадр в формате BGR."""
+        if not self._opened:
+            return False, None
+        shift = np.uint8(self.index * 4 % 256)
+        frame = cv2.merge([self._base + shift, self._base,
+                           255 - self._base])
+        cv2.putText(frame, str(self.index), (10, 40),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 2)
+        self.index += 1
+        return True, frame
+
+    def get(self, prop):
+        """Свойство источника (поддерживается только частота кадров)."""
+        return self.fps if prop == cv2.CAP_PROP_FPS else 0
+
+    def release(self):
+        """Закрытие источника."""
+        self._opened = False
+
+
+def open_capture(source):
+    """
+    Открытие источника кадров.
+
+    Аргументы:
+        source: Номер устройства, путь к видеофайлу или "synthetic"
+
+    Возвращает:
+        tuple: (объект захвата, нужно ли ограничивать частоту чтения)
+    """
+    if source == SYNTHETIC_SOURCE:
+        return SyntheticSource(), True
+    if isinstance(source, int) or str(source).isdigit():
+        # Устройство само отдает кадры в своем темпе
+        return cv2.VideoCapture(int(source)), False
+    return cv2.VideoCapture(str(source)), True
+
+
+def probe(source):
+    """
+    Проверка источника кадров: открытие и сразу освобождение.
+
+    Аргументы:
+        source: Номер устройства, путь к видеофайлу или "synthetic"
+
+    Возвращает:
+        bool: Удалось ли открыть источник
+    """
+    capture, _ = open_capture(source)
+    if capture is None or not capture.isOpened():
+        return False
+    capture.release()
+    return True
+
+
+class CameraSession:
+    """Сеанс захвата с потоком чтения и кольцевым буфером кадров."""
+
+    def __init__(self, source=0, buffer_size=DEFAULT_BUFFER_SIZE,
+                 warmup_frames=WARMUP_FRAMES):
+        """
+        Аргументы:
+            source: Номер устройства, путь к видеофайлу или "synthetic"
+            buffer_size (int): Число хранимых последних кадров
+            warmup_frames (int): Число пропускаемых первых кадров
+        """
+        self.source = source
+        self.warmup_frames = warmup_frames
+        self.frames = deque(maxlen=buffer_size)
+        self.frame_count = 0   # Номер последнего прочитанного кадра
+        self.error = None      # Причина остановки потока чтения
+        self._capture = None
+        self._thread = None
+        self._skip_until = 0   # Номер последнего пропускаемого кадра
+        self._stop = threading.Event()
+        self._condition = threading.Condition()
+        self._lock = threading.Lock()  # Запуск и остановка
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def running(self):
+        """Работает ли поток чтения."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """
+        Открытие источника и запуск потока чтения.
+
+        Сеанс можно запускать повторно после stop: кадры прошлого
+        запуска отбрасываются, а номера кадров продолжают расти.
+
+        Возвращает:
+            bool: Удалось ли открыть источник
+        """
+        with self._lock:
+            if self.running:
+                return True
+            capture, throttle = open_capture(self.source)
+            if capture is None or not capture.isOpened():
+                self.error = "Не удалось открыть источник кадров"
+                return False
+
+            with self._condition:
+                self.frames.clear()
+                self._skip_until = self.frame_count + self.warmup_frames
+            self._capture = capture
+            self._stop.clear()
+            self.error = None
+            self._thread = threading.Thread(
+                target=self._grab_loop, args=(throttle,),
+                name="camera-grabber", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """Остановка потока чтения и освобождение источника."""
+        with self._lock:
+            self._stop.set()
+            if self._thread is not None:
+                self._thread.join(timeout=2)
+                self._thread = None
+            if self._capture is not None:
+                self._capture.release()
+                self._capture = None
+        with self._condition:
+            self._condition.notify_all()
+
+    def _grab_loop(self, throttle):
+        """Непрерывное чтение кадров в буфер (в отдельном потоке)."""
+        fps = self._capture.get(cv2.CAP_PROP_FPS) or 30
+        interval = 1 / fps if throttle else 0
+        next_time = time.perf_counter()
+
+        while not self._stop.is_set():
+            ret, frame = self._capture.read()
+            if not ret:
+                self.error = "Источник кадров закончился или недоступен"
+                break
+
+            with self._condition:
+                self.frame_count += 1
+                if self.frame_count > self._skip_until:
+                    self.frames.append((self.frame_count, frame))
+                    self._condition.notify_all()
+
+            if interval:
+                next_time += interval
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_time = time.perf_counter()
+
+        with self._condition:
+            self._condition.notify_all()
+
+    def latest(self, newer_than=0, timeout=None):
+        """
+        Последний кадр из буфера.
+
+        Аргументы:
+            newer_than (int): Ждать кадр с номером больше этого
+            timeout (float): Максимальное время ожидания, с (None -
+                не ждать)
+
+        Возвращает:
+            tuple: (номер кадра, кадр BGR) или (0, None)
+        """
+        with self._condition:
+            if timeout is not None:
+                self._condition.wait_for(
+                    lambda: (self.frames and
+                             self.frames[-1][0] > newer_than) or
+                    not self.running,
+                    timeout
+                )
+            if self.frames and self.frames[-1][0] > newer_than:
+                return self.frames[-1]
+        return 0, None
+
+    def snapshot(self, timeout=2.0):
+        """
+        Снимок - последний кадр буфера в формате RGB.
+
+        Аргументы:
+            timeout (float): Время ожидания первого кадра, с
+
+        Возвращает:
+            np.ndarray: RGB-изображение или None
+        """
+        _, frame = self.latest(timeout=timeout)
+        if frame is None:
+            return None
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
@@ -0,0 +1,188 @@
+"""
+Кэш декодированных изображений с уменьшенным декодированием и
+предварительной загрузкой соседних файлов папки.
+
+Изображения хранятся в LRU-кэше с ограничением по байтам под ключом из
+пути, времени изменения и размера файла, так что измененный на диске
+файл декодируется заново. Когда нужен только предпросмотр, JPEG
+декодируется сразу в уменьшенном виде флагами IMREAD_REDUCED_COLOR_*,
+что в несколько раз быстрее полного декодирования.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2  # pylint: disable=import-error
+from PIL import Image
+
+import tracing
+from graph import ResultCache
+
+DEFAULT_BUDGET = 1024 * 1024 * 1024  # Бюджет кэша по умолчанию, байт
+PREFETCH_RADIUS = 2                  # Число соседей с каждой стороны
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff",
+                    ".webp")
+
+# Флаги уменьшенного декодирования по коэффициенту уменьшения
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def list_images(folder):
+    """
+    Отсортированный список изображений в папке.
+
+    Аргументы:
+        folder (str): Путь к папке
+
+    Возвращает:
+        list: Полные пути к файлам изображений
+    """
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+        and os.path.isfile(os.path.join(folder, name))
+    )
+
+
+def file_key(path):
+    """
+    Ключ файла: путь, время изменения и размер.
+
+    Аргументы:
+        path (str): Путь к файлу
+
+    Возвращает:
+        str: Ключ, меняющийся при изменении файла
+    """
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def reduction_for(path, target_size):
+    """
+    Наибольшее уменьшение, при котором большая сторона не меньше
+    требуемой.
+
+    Размеры читаются из заголовка файла, без декодирования.
+
+    Аргументы:
+        path (str): Путь к изображению
+        target_size (int): Требуемая длина большей стороны
+
+    Возвращает:
+        int: 1, 2, 4 или 8
+    """
+    try:
+        with Image.open(path) as image:
+            longest = max(image.size)
+    except OSError:
+        return 1
+    for reduction in (8, 4, 2):
+        if longest // reduction >= target_size:
+            return reduction
+    return 1
+
+
+class DecodeCache:
+    """LRU-кэш декодированных RGB-изображений с фоновой подгрузкой."""
+
+    def __init__(self, budget=DEFAULT_BUDGET, prefetch_workers=1):
+        """
+        Аргументы:
+            budget (int): Максимальный суммарный размер, байт
+            prefetch_workers (int): Число потоков подгрузки
+        """
+        self.cache = ResultCache(budget)
+        self._pool = ThreadPoolExecutor(max_workers=prefetch_workers,
+                                        thread_name_prefix="prefetch")
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def decode(self, path, reduction=1):
+        """
+        Декодирование изображения с использованием кэша.
+
+        Аргументы:
+            path (str): Путь к изображению
+            reduction (int): Уменьшение при декодировании (1, 2, 4, 8)
+
+        Возвращает:
+            np.ndarray: RGB-изображение только для чтения
+
+        Исключения:
+            ValueError: Файл не удалось декодировать
+        """
+        key = f"{file_key(path)}@{reduction}"
+        image = self.cache.get(key)
+        if image is not None:
+            return image
+
+        with tracing.span("decode", path=path,
+                          reduction=reduction) as span:
+            image = span.record(cv2.imread(path, REDUCED_FLAGS[reduction]))
+        if image is None:
+            raise ValueError(f"Не удалось загрузить изображение: {path}")
+        with tracing.span("convert") as span:
+            image = span.record(cv2.cvtColor(image, cv2.COLOR_BGR2RGB,
+                                             dst=image))
+        self.cache.put(key, image)
+        return image
+
+    def discard(self, key, reduction=1):
+        """
+        Удаление декодированного изображения из кэша.
+
+        Аргументы:
+            key (str): Ключ файла (file_key)
+            reduction (int): Уменьшение при декодировании
+        """
+        self.cache.discard(f"{key}@{reduction}")
+
+    def decode_preview(self, path, target_size):
+        """Декодирование в наименьшем разрешении, достаточном для
+        предпросмотра заданного размера."""
+        return self.decode(path, reduction_for(path, target_size))
+
+    def prefetch(self, paths, target_size=None):
+        """
+        Фоновая подгрузка изображений в кэш.
+
+        Новый вызов отменяет еще не начатую подгрузку предыдущего.
+
+        Аргументы:
+            paths (list): Пути в порядке приоритета
+            target_size (int): Размер предпросмотра или None для полного
+                разрешения
+        """
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        for path in paths:
+            self._pool.submit(self._prefetch_one, path, target_size,
+                              generation)
+
+    def _prefetch_one(self, path, target_size, generation):
+        """Подгрузка одного файла, если запрос еще актуален."""
+        if generation != self._generation:
+            return
+        try:
+            if target_size is None:
+                self.decode(path)
+            else:
+                self.decode_preview(path, target_size)
+        except (OSError, ValueError):
+            # Поврежденный файл покажет ошибку при явном открытии
+            pass
+
+    def shutdown(self):
+        """Остановка потоков подгрузки."""
+        with self._lock:
+            self._generation += 1
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,152 @@
+"""
+Экспорт результата в файлы JPEG, PNG и WebP.
+
+Кодирование выполняется cv2.imencode, который освобождает GIL, поэтому
+несколько экспортов в фоновых потоках кодируются параллельно. Файл
+сначала записывается во временный файл в том же каталоге и затем
+атомарно переименовывается, так что прерванный экспорт не оставляет
+поврежденного файла. Время кодирования и размер результата
+возвращаются вызывающему, чтобы по ним можно было выбрать настройки
+сжатия.
+"""
+
+import os
+import time
+import uuid
+
+import cv2  # pylint: disable=import-error
+
+# Расширение -> название формата для интерфейса
+FORMATS = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG", ".webp": "WebP"}
+DEFAULT_QUALITY = 95        # Качество JPEG и WebP (1-100)
+DEFAULT_COMPRESSION = 3     # Уровень сжатия PNG (0-9)
+# Флаги создания временного файла: только новый, двоичный режим
+_CREATE_FLAGS = (os.O_CREAT | os.O_EXCL | os.O_WRONLY |
+                 getattr(os, "O_BINARY", 0))
+
+
+def encode_params(extension, quality=DEFAULT_QUALITY,
+                  compression=DEFAULT_COMPRESSION, progressive=False,
+                  optimize=False):
+    """
+    Параметры cv2.imencode для формата.
+
+    Аргументы:
+        extension (str): Расширение файла (.jpg, .png, .webp)
+        quality (int): Качество JPEG и WebP (1-100)
+        compression (int): Уровень сжатия PNG (0-9)
+        progressive (bool): Прогрессивный JPEG
+        optimize (bool): Оптимизация таблиц Хаффмана JPEG
+
+    Возвращает:
+        list: Пары флаг, значение для cv2.imencode
+
+    Исключения:
+        ValueError: Неизвестный формат или недопустимые параметры
+    """
+    extension = extension.lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Неподдерживаемый формат: {extension}")
+    if not 1 <= quality <= 100:
+        raise ValueError(f"Качество должно быть от 1 до 100: {quality}")
+    if not 0 <= compression <= 9:
+        raise ValueError(f"Сжатие PNG должно быть от 0 до 9: {compression}")
+
+    if FORMATS[extension] == "JPEG":
+        return [cv2.IMWRITE_JPEG_QUALITY, quality,
+                cv2.IMWRITE_JPEG_PROGRESSIVE, int(progressive),
+                cv2.IMWRITE_JPEG_OPTIMIZE, int(optimize)]
+    if FORMATS[extension] == "PNG":
+        return [cv2.IMWRITE_PNG_COMPRESSION, compression]
+    return [cv2.IMWRITE_WEBP_QUALITY, quality]
+
+
+def encode(image, extension, **options):
+    """
+    Кодирование RGB-изображения.
+
+    Аргументы:
+        image (np.ndarray): RGB-изображение (не изменяется)
+        extension (str): Расширение файла
+        **options: Параметры encode_params
+
+    Возвращает:
+        bytes: Закодированный файл
+
+    Исключения:
+        ValueError: Неизвестный формат, недопустимые параметры или
+            ошибка кодирования
+    """
+    params = encode_params(extension, **options)
+    bgr = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    ok, data = cv2.imencode(extension, bgr, params)
+    if not ok:
+        raise ValueError(f"Не удалось закодировать {extension}")
+    return data.tobytes()
+
+
+def write_atomic(path, data):
+    """
+    Запись файла через временный файл с атомарной заменой.
+
+    Аргументы:
+        path (str): Путь к результату
+        data (bytes): Содержимое
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    temp_path = os.path.join(
+        directory, f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+    # Права нового файла определяются маской процесса, как у open
+    handle = os.open(temp_path, _CREATE_FLAGS, 0o666)
+    try:
+        with os.fdopen(handle, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def export_image(image, path, **options):
+    """
+    Кодирование изображения и запись в файл.
+
+    Формат определяется расширением пути.
+
+    Аргументы:
+        image (np.ndarray): RGB-изображение
+        path (str): Путь к результату
+        **options: Параметры encode_params
+
+    Возвращает:
+        dict: path, encode_time и write_time (с), size (байт)
+
+    Исключения:
+        ValueError: Неизвестный формат или недопустимые параметры
+        OSError: Ошибка записи файла
+    """
+    extension = os.path.splitext(path)[1]
+    started = time.perf_counter()
+    data = encode(image, extension, **options)
+    encoded = time.perf_counter()
+    write_atomic(path, data)
+    return {
+        "path": path,
+        "encode_time": encoded - started,
+        "write_time": time.perf_counter() - encoded,
+        "size": len(data),
+    }
+
+
+def format_size(size):
+    """Размер в байтах в виде строки для интерфейса."""
+    if size < 1024:
+        return f"{size} Б"
+    if size < 1024 ** 2:
+        return f"{size / 1024:.1f} КБ"
+    return f"{size / 1024 ** 2:.1f} МБ"
@@ -0,0 +1,209 @@
+"""
+Слияние цепочек поточечных операций в один проход по изображению.
+
+Операции выбора канала, яркости и оттенков серого поточечные: результат
+для пикселя зависит только от самого пикселя. После первой операции,
+сводящей пиксель к одному скаляру (выбор канала или оттенки серого),
+все последующие поточечные операции выражаются тремя таблицами на 256
+значений. Таблицы вычисляются применением эталонных функций из
+``operations`` к изображению-шкале из 256 пикселей, поэтому результат
+побитово совпадает с последовательным применением операций.
+
+Подряд идущие линии собираются в слой ``annotations.LineLayer`` и
+рисуются пакетом. Яркость полноцветного изображения таблицей не
+выражается и выполняется эталонной функцией; такие операции разделяют
+рецепт на несколько проходов.
+"""
+
+import cv2  # pylint: disable=import-error
+import numpy as np
+
+import annotations
+import operations
+
+# Операции, результат которых зависит только от значения пикселя
+POINTWISE_OPERATIONS = ("channel", "brightness", "grayscale")
+
+GRAY_SOURCE = "gray"  # Источник скаляра - яркость по формуле OpenCV
+
+_RAMP = np.arange(256, dtype=np.uint8)
+
+
+class FusedPass:
+    """
+    Слитый поточечный проход.
+
+    Пока ``source`` равен None, проход тождественный. После сведения
+    пикселя к скаляру ``source`` - индекс канала RGB или GRAY_SOURCE,
+    а ``luts`` - таблицы (3, 256), задающие выходные каналы по скаляру.
+    """
+
+    def __init__(self):
+        """Создание тождественного прохода."""
+        self.source = None
+        self.luts = None
+        self.operations = []
+
+    def absorb(self, name, params):
+        """
+        Попытка включить операцию в проход.
+
+        Аргументы:
+            name (str): Имя операции
+            params (dict): Параметры операции
+
+        Возвращает:
+            bool: True, если операция включена в проход
+        """
+        if name not in POINTWISE_OPERATIONS:
+            return False
+
+        if self.source is None:
+            if name == "channel":
+                channel = operations.CHANNEL_BY_LABEL.get(
+                    params["channel"], params["channel"])
+                if channel != "all":
+                    index = operations.CHANNEL_INDEX[channel]
+                    self.source = index
+                    self.luts = np.zeros((3, 256), dtype=np.uint8)
+                    self.luts[index] = _RAMP
+            elif name == "grayscale":
+                self.source = GRAY_SOURCE
+                self.luts = np.tile(_RAMP, (3, 1))
+            else:
+                # Яркость полноцветного изображения не сводится к таблице
+                return False
+        else:
+            # Пиксель уже определяется скаляром: прогоняем операцию
+            # через шкалу всех его возможных значений
+            table = np.ascontiguousarray(self.luts.T[np.newaxis])
+            table = operations.apply_operation(table, name, params)
+            self.luts = np.ascontiguousarray(table[0].T)
+
+        self.operations.append((name, params))
+        return True
+
+    def run(self, image, dst=None, pool=None):
+        """
+        Выполнение прохода над изображением.
+
+        Аргументы:
+            image (np.ndarray): Исходное RGB-изображение
+            dst (np.ndarray): Массив для результата (может совпадать с
+                image) или None
+            pool (buffers.BufferPool): Пул для промежуточного скаляра
+                или None
+
+        Возвращает:
+            np.ndarray: RGB-изображение с результатом
+        """
+        if self.source is None:
+            return operations.apply_channel(image, "all", dst)
+
+        scalar = pool.acquire(image.shape[:2]) if pool is not None \
+            else None
+        if self.source == GRAY_SOURCE:
+            scalar = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY, dst=scalar)
+        else:
+            scalar = cv2.extractChannel(image, self.source, dst=scalar)
+
+        red, green, blue = self.luts
+        if (red == green).all() and (green == blue).all():
+            cv2.LUT(scalar, red, dst=scalar)
+            result = cv2.cvtColor(scalar, cv2.COLOR_GRAY2RGB, dst=dst)
+        else:
+            # Таблица (1, 256, 3) применяется к каждому каналу своя
+            result = cv2.cvtColor(scalar, cv2.COLOR_GRAY2RGB, dst=dst)
+            cv2.LUT(result, np.ascontiguousarray(self.luts.T[np.newaxis]),
+                    dst=result)
+
+        if pool is not None:
+            pool.release(scalar)
+        return result
+
+
+def compile_recipe(recipe):
+    """
+    Компиляция рецепта в последовательность проходов.
+
+    Аргументы:
+        recipe (list): Список кортежей (имя операции, параметры)
+
+    Возвращает:
+        list: Элементы FusedPass, слои линий annotations.LineLayer или
+        кортежи (имя, параметры) для операций, выполняемых эталонными
+        функциями
+    """
+    stages = []
+    current = None
+    for name, params in recipe:
+        if name == "line":
+            current = None
+            if not stages or not isinstance(stages[-1],
+                                            annotations.LineLayer):
+                stages.append(annotations.LineLayer())
+            stages[-1].add(params["start"], params["end"],
+                           params["thickness"],
+                           params.get("color", operations.LINE_COLOR))
+            continue
+        if current is not None and current.absorb(name, params):
+            continue
+        current = FusedPass()
+        if current.absorb(name, params):
+            stages.append(current)
+        else:
+            current = None
+            stages.append((name, params))
+
+    # Тождественные проходы не нужны
+    return [
+        stage for stage in stages
+        if not isinstance(stage, FusedPass) or stage.source is not None
+    ]
+
+
+def run_compiled(image, stages, dst=None, pool=None):
+    """
+    Выполнение скомпилированного рецепта.
+
+    Первая стадия пишет в dst (или в новый массив), остальные
+    выполняются на месте, так что цепочка использует один буфер.
+
+    Аргументы:
+        image (np.ndarray): Исходное RGB-изображение
+        stages (list): Результат compile_recipe
+        dst (np.ndarray): Массив для результата или None; передача
+            самого image включает обработку на месте
+        pool (buffers.BufferPool): Пул для промежуточных буферов или None
+
+    Возвращает:
+        np.ndarray: Результирующее RGB-изображение
+    """
+    if not stages:
+        return operations.apply_channel(image, "all", dst)
+    for stage in stages:
+        if isinstance(stage, FusedPass):
+            image = dst = stage.run(image, dst, pool)
+        elif isinstance(stage, annotations.LineLayer):
+            image = dst = stage.rasterize(image, dst=dst)
+        else:
+            image = dst = operations.apply_operation(image, *stage, dst=dst)
+    return image
+
+
+def apply_recipe(image, recipe, dst=None, pool=None):
+    """
+    Применение рецепта со слиянием поточечных операций.
+
+    Результат совпадает с operations.apply_recipe.
+
+    Аргументы:
+        image (np.ndarray): Исходное RGB-изображение
+        recipe (list): Список кортежей (имя операции, параметры)
+        dst (np.ndarray): Массив для результата или None
+        pool (buffers.BufferPool): Пул для промежуточных буферов или None
+
+    Возвращает:
+        np.ndarray: Результирующее RGB-изображение
+    """
+    return run_compiled(image, compile_recipe(recipe), dst, pool)
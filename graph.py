@@ -0,0 +1,298 @@
+"""
+Неразрушающая модель редактирования: цепочка операций над исходным
+изображением с кэшированием промежуточных результатов.
+
+Цепочка может вычисляться на любом уровне пирамиды исходного
+изображения: предпросмотр считается на уменьшенной копии, а полное
+разрешение - только по запросу.
+
+Результат каждого узла хранится в LRU-кэше по ключу, построенному из
+ключа входа узла и его параметров. Поэтому изменение параметров одного
+узла пересчитывает только узлы после него, а узлы до него берутся из
+кэша.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import operations
+import pyramid
+import tracing
+
+DEFAULT_CACHE_BUDGET = 512 * 1024 * 1024  # Бюджет кэша по умолчанию, байт
+
+
+def image_key(image):
+    """
+    Ключ содержимого изображения.
+
+    Аргументы:
+        image (np.ndarray): Изображение
+
+    Возвращает:
+        str: Хэш формы, типа и данных изображения
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((image.shape, image.dtype.str)).encode())
+    digest.update(memoryview(image).cast("B") if image.flags.c_contiguous
+                  else image.tobytes())
+    return digest.hexdigest()
+
+
+def node_key(input_key, name, params):
+    """
+    Ключ результата узла по ключу входа и параметрам операции.
+
+    Аргументы:
+        input_key (str): Ключ входного изображения
+        name (str): Имя операции
+        params (dict): Параметры операции
+
+    Возвращает:
+        str: Хэш узла
+    """
+    text = repr((input_key, name, sorted(params.items())))
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """
+    LRU-кэш изображений с ограничением суммарного размера в байтах.
+
+    Безопасен для использования из фоновых потоков.
+    """
+
+    def __init__(self, budget=DEFAULT_CACHE_BUDGET):
+        """
+        Аргументы:
+            budget (int): Максимальный суммарный размер, байт
+        """
+        self.budget = budget
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """Получение изображения по ключу (None при промахе)."""
+        with self._lock:
+            image = self._items.get(key)
+            if image is not None:
+                self._items.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        """
+        Сохранение изображения с вытеснением давно не использованных.
+
+        Изображения больше всего бюджета не сохраняются.
+        """
+        if image.nbytes > self.budget:
+            return
+        # Результаты в кэше не должны меняться на месте
+        image.flags.writeable = False
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return
+            self._items[key] = image
+            self.size += image.nbytes
+            while self.size > self.budget:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= evicted.nbytes
+
+    def discard(self, key):
+        """Удаление изображения по ключу, если оно есть в кэше."""
+        with self._lock:
+            image = self._items.pop(key, None)
+            if image is not None:
+                self.size -= image.nbytes
+
+    def clear(self):
+        """Очистка кэша."""
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
+class OperationGraph:
+    """
+    Цепочка операций над исходным изображением.
+
+    Узлы хранятся как кортежи (имя операции, параметры) в формате
+    рецептов ``operations``; результаты вычисляются лениво.
+    """
+
+    def __init__(self, cache=None):
+        """
+        Аргументы:
+            cache (ResultCache): Кэш результатов (по умолчанию - новый)
+        """
+        self.cache = cache if cache is not None else ResultCache()
+        self.source = None
+        self.source_key = None
+        self.levels = []
+        self.nodes = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def prepare_source(image, key=None):
+        """
+        Подготовка исходного изображения: ключ и пирамида.
+
+        Самая долгая часть set_source; может выполняться в фоновом
+        потоке.
+
+        Аргументы:
+            image (np.ndarray): Исходное RGB-изображение
+            key (str): Готовый ключ (например, по пути и времени
+                изменения файла); по умолчанию - хэш содержимого
+
+        Возвращает:
+            tuple: (ключ, уровни пирамиды)
+        """
+        image.flags.writeable = False
+        if key is None:
+            with tracing.span("hash"):
+                key = image_key(image)
+        with tracing.span("pyramid"):
+            levels = pyramid.build_pyramid(image)
+        return key, levels
+
+    def set_source(self, image, key=None, levels=None):
+        """
+        Установка исходного изображения.
+
+        Аргументы:
+            image (np.ndarray): Исходное RGB-изображение
+            key (str): Ключ изображения (по умолчанию - хэш содержимого)
+            levels (list): Готовая пирамида (по умолчанию строится)
+        """
+        if levels is None:
+            key, levels = self.prepare_source(image, key)
+        image.flags.writeable = False
+        with self._lock:
+            self.source = image
+            self.source_key = key
+            self.levels = levels
+
+    def append(self, name, params):
+        """Добавление узла в конец цепочки; возвращает его индекс."""
+        self.nodes.append((name, dict(params)))
+        return len(self.nodes) - 1
+
+    def insert(self, index, name, params):
+        """Вставка узла в заданную позицию цепочки."""
+        self.nodes.insert(index, (name, dict(params)))
+
+    def update(self, index, params):
+        """Изменение параметров узла."""
+        name, _ = self.nodes[index]
+        self.nodes[index] = (name, dict(params))
+
+    def remove(self, index):
+        """Удаление узла."""
+        del self.nodes[index]
+
+    def clear(self):
+        """Удаление всех узлов (исходное изображение сохраняется)."""
+        self.nodes = []
+
+    def find(self, name):
+        """Индекс первого узла с заданной операцией или None."""
+        for index, (node_name, _) in enumerate(self.nodes):
+            if node_name == name:
+                return index
+        return None
+
+    def level_nodes(self, level=0, levels=None, nodes=None):
+        """Узлы с параметрами, пересчитанными для уровня пирамиды."""
+        levels = self.levels if levels is None else levels
+        nodes = self.nodes if nodes is None else nodes
+        scale = pyramid.level_scale(levels, level)
+        return [
+            (name, operations.scale_params(name, params, scale))
+            for name, params in nodes
+        ]
+
+    def keys(self, level=0, source_key=None, nodes=None):
+        """Ключи результатов всех узлов по порядку."""
+        source_key = self.source_key if source_key is None else source_key
+        nodes = self.level_nodes(level) if nodes is None else nodes
+        keys = []
+        key = source_key if level == 0 else f"{source_key}@{level}"
+        for name, params in nodes:
+            key = node_key(key, name, params)
+            keys.append(key)
+        return keys
+
+    def level_scale(self, level):
+        """Масштаб уровня пирамиды относительно исходного изображения."""
+        return pyramid.level_scale(self.levels, level)
+
+    def preview_level(self, target_size):
+        """Уровень пирамиды для предпросмотра заданного размера."""
+        return pyramid.select_level(self.levels, target_size)
+
+    def result(self, upto=None, level=0, progress=None, nodes=None):
+        """
+        Результат цепочки до узла ``upto`` включительно.
+
+        Вычисление начинается с самого позднего узла, найденного в
+        кэше; все вычисленные промежуточные результаты кэшируются.
+        Состояние цепочки фиксируется в начале вызова, поэтому метод
+        можно вызывать из фонового потока, пока главный поток меняет
+        узлы.
+
+        Аргументы:
+            upto (int): Индекс последнего узла (по умолчанию - весь)
+            level (int): Уровень пирамиды (0 - полное разрешение)
+            progress (callable): Функция progress(готово, всего),
+                вызываемая после каждого вычисленного узла
+            nodes (list): Снимок узлов цепочки (по умолчанию - текущие)
+
+        Возвращает:
+            np.ndarray: Изображение (только для чтения) или None
+        """
+        with self._lock:
+            source_key, levels = self.source_key, self.levels
+        if not levels:
+            return None
+        nodes = list(self.nodes if nodes is None else nodes)
+        count = len(nodes) if upto is None else upto + 1
+        nodes = self.level_nodes(level, levels, nodes[:count])
+        keys = self.keys(level, source_key, nodes)
+
+        start, image = 0, levels[level]
+        for index in range(count - 1, -1, -1):
+            cached = self.cache.get(keys[index])
+            if cached is not None:
+                start, image = index + 1, cached
+                break
+
+        for index in range(start, count):
+            name, params = nodes[index]
+            with tracing.span(f"op:{name}", level=level) as span:
+                image = span.record(
+                    operations.apply_operation(image, name, params))
+            self.cache.put(keys[index], image)
+            if progress is not None:
+                progress(index - start + 1, count - start)
+        return image
+
+    def to_text(self):
+        """Текст рецепта цепочки."""
+        return operations.format_recipe(self.nodes)
+
+    def load_text(self, text):
+        """Замена цепочки рецептом из текста."""
+        self.nodes = [
+            (name, dict(params))
+            for name, params in operations.parse_recipe(text)
+        ]
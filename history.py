@@ -0,0 +1,203 @@
+"""
+История правок с отменой и повтором.
+
+Изображение на экране полностью определяется исходником, цепочкой
+операций и слоем линий, а пиксели заново выводятся из них (с кэшем
+результатов графа). Поэтому шаг истории хранит не копию кадра, а
+компактную разницу: для линии - ее запись в слое, для поточечных
+операций - параметры узлов цепочки. Полный снимок состояния (сжатый)
+сохраняется только в контрольных точках - при сбросе и загрузке
+рецепта, когда меняется все сразу. Суммарный размер истории
+ограничен бюджетом; при его превышении вытесняются самые старые шаги.
+"""
+
+import pickle
+import zlib
+from collections import deque
+
+import operations
+
+DEFAULT_BUDGET = 16 * 1024 * 1024  # Бюджет истории по умолчанию, байт
+
+# Виды шагов истории
+NODES = "nodes"            # Узлы цепочки: (до, после)
+LINE_ADD = "line_add"      # Добавлена линия: (идентификатор, параметры)
+LINE_REMOVE = "line_remove"  # Удалена линия: (идентификатор, параметры)
+LINE_UPDATE = "line_update"  # Изменена линия: (идентификатор, до, после)
+CHECKPOINT = "checkpoint"  # Сжатые снимки: (до, после)
+
+
+class _Step:
+    """Шаг истории."""
+
+    __slots__ = ("kind", "label", "data", "size")
+
+    def __init__(self, kind, label, data):
+        self.kind = kind
+        self.label = label
+        self.data = data
+        # Оценка занимаемой памяти по сериализованному виду
+        self.size = len(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+
+class History:
+    """
+    Стеки отмены и повтора правок цепочки и слоя линий.
+
+    Правка сначала выполняется над графом и слоем, затем
+    регистрируется соответствующим методом record_*.
+    """
+
+    def __init__(self, graph, layer, budget=DEFAULT_BUDGET):
+        """
+        Аргументы:
+            graph (graph.OperationGraph): Цепочка операций
+            layer (annotations.LineLayer): Слой линий
+            budget (int): Наибольший суммарный размер истории, байт
+        """
+        self.graph = graph
+        self.layer = layer
+        self.budget = budget
+        self.size = 0
+        self._undo = deque()
+        self._redo = []
+
+    @property
+    def can_undo(self):
+        """Есть ли шаг для отмены."""
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        """Есть ли шаг для повтора."""
+        return bool(self._redo)
+
+    def clear(self):
+        """Удаление всей истории (например, при смене изображения)."""
+        self._undo.clear()
+        self._redo.clear()
+        self.size = 0
+
+    def _push(self, kind, label, data):
+        """Добавление шага с вытеснением старых сверх бюджета."""
+        for step in self._redo:
+            self.size -= step.size
+        self._redo.clear()
+        step = _Step(kind, label, data)
+        self._undo.append(step)
+        self.size += step.size
+        while self.size > self.budget and len(self._undo) > 1:
+            self.size -= self._undo.popleft().size
+
+    def record_nodes(self, label, before):
+        """
+        Регистрация изменения узлов цепочки.
+
+        Аргументы:
+            label (str): Описание правки
+            before (list): Узлы цепочки до правки
+        """
+        after = list(self.graph.nodes)
+        if after != before:
+            self._push(NODES, label, (list(before), after))
+
+    def record_line_add(self, label, line_id):
+        """Регистрация добавленной линии."""
+        self._push(LINE_ADD, label, (line_id, self.layer.get(line_id)))
+
+    def record_line_remove(self, label, line_id, params):
+        """
+        Регистрация удаленной линии.
+
+        Аргументы:
+            label (str): Описание правки
+            line_id (int): Идентификатор удаленной линии
+            params (dict): Ее параметры до удаления
+        """
+        self._push(LINE_REMOVE, label, (line_id, params))
+
+    def record_line_update(self, label, line_id, before):
+        """Регистрация изменения линии (before - параметры до правки)."""
+        self._push(LINE_UPDATE, label,
+                   (line_id, before, self.layer.get(line_id)))
+
+    def snapshot(self):
+        """Сжатый снимок цепочки и слоя для контрольной точки."""
+        state = (list(self.graph.nodes),
+                 list(zip(self.layer.ids, self.layer.to_recipe())))
+        return zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+    def record_checkpoint(self, label, before):
+        """
+        Регистрация правки, меняющей все состояние.
+
+        Аргументы:
+            label (str): Описание правки
+            before (bytes): Снимок до правки (результат snapshot)
+        """
+        self._push(CHECKPOINT, label, (before, self.snapshot()))
+
+    def _restore(self, snapshot):
+        """Восстановление цепочки и слоя из снимка."""
+        nodes, lines = pickle.loads(zlib.decompress(snapshot))
+        self.graph.clear()
+        for name, params in nodes:
+            self.graph.append(name, params)
+        self.layer.clear()
+        for line_id, (_, params) in lines:
+            self._restore_line(line_id, params)
+
+    def _restore_line(self, line_id, params):
+        """Возврат линии на ее прежнее место в порядке рисования."""
+        self.layer.restore(line_id, **params)
+
+    def _apply(self, step, forward):
+        """Выполнение (forward) или отмена шага."""
+        if step.kind == NODES:
+            before, after = step.data
+            self.graph.clear()
+            for name, params in after if forward else before:
+                self.graph.append(name, params)
+        elif step.kind == CHECKPOINT:
+            before, after = step.data
+            self._restore(after if forward else before)
+        elif step.kind == LINE_UPDATE:
+            line_id, before, after = step.data
+            params = after if forward else before
+            self.layer.update(line_id, params["start"], params["end"],
+                              params["thickness"],
+                              params.get("color", operations.LINE_COLOR))
+        else:
+            line_id, params = step.data
+            if (step.kind == LINE_ADD) == forward:
+                self._restore_line(line_id, params)
+            else:
+                self.layer.remove(line_id)
+
+    def undo(self):
+        """
+        Отмена последней правки.
+
+        Возвращает:
+            str: Описание отмененной правки или None
+        """
+        if not self._undo:
+            return None
+        step = self._undo.pop()
+        self._apply(step, forward=False)
+        self._redo.append(step)
+        return step.label
+
+    def redo(self):
+        """
+        Повтор последней отмененной правки.
+
+        Возвращает:
+            str: Описание повторенной правки или None
+        """
+        if not self._redo:
+            return None
+        step = self._redo.pop()
+        self._apply(step, forward=True)
+        self._undo.append(step)
+        return step.label
@@ -0,0 +1,191 @@
+"""
+Фоновое выполнение операций для графического интерфейса.
+
+Задачи выполняются в рабочих потоках (OpenCV освобождает GIL на время
+вычислений), а их результаты передаются обратно в главный поток Tk
+через очередь, опрашиваемую методом ``after``. Каждая задача имеет
+ключ: новая задача с тем же ключом вытесняет предыдущую, поэтому из
+серии быстрых повторных запросов выполняется только последний.
+"""
+
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_INTERVAL = 30  # Период опроса очереди результатов, мс
+
+
+class JobCancelled(Exception):
+    """Задача отменена или вытеснена более новой."""
+
+
+class Job:
+    """Фоновая задача с флагом отмены и отчетом о прогрессе."""
+
+    def __init__(self, executor, key, func, on_done, on_error):
+        """
+        Аргументы:
+            executor (JobExecutor): Исполнитель задачи
+            key (str): Ключ задачи для вытеснения
+            func (callable): Функция func(job), выполняемая в потоке
+            on_done (callable): Обработчик результата в главном потоке
+            on_error (callable): Обработчик исключения в главном потоке
+        """
+        self.executor = executor
+        self.key = key
+        self.func = func
+        self.on_done = on_done
+        self.on_error = on_error
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        """Отменена ли задача."""
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Отмена задачи; уже выполняющаяся задача прервется на
+        ближайшей проверке."""
+        self._cancelled.set()
+
+    def check(self):
+        """Прерывание выполнения, если задача отменена."""
+        if self.cancelled:
+            raise JobCancelled()
+
+    def report(self, done, total):
+        """
+        Отчет о прогрессе из рабочего потока (с проверкой отмены).
+
+        Аргументы:
+            done (int): Выполнено шагов
+            total (int): Всего шагов
+        """
+        self.check()
+        self.executor.post(self, "progress", (done, total))
+
+
+class JobExecutor:
+    """Пул рабочих потоков с доставкой результатов в главный поток Tk."""
+
+    def __init__(self, widget, workers=1, on_progress=None,
+                 poll_interval=POLL_INTERVAL):
+        """
+        Аргументы:
+            widget (tk.Misc): Виджет, через который планируется опрос
+            workers (int): Число рабочих потоков
+            on_progress (callable): Обработчик on_progress(job, done,
+                total) в главном потоке или None
+            poll_interval (int): Период опроса очереди, мс
+        """
+        self.widget = widget
+        self.on_progress = on_progress
+        self.poll_interval = poll_interval
+        self._pool = ThreadPoolExecutor(max_workers=workers,
+                                        thread_name_prefix="job")
+        self._events = queue.Queue()
+        self._latest = {}
+        self._pending = 0
+        self._polling = False
+
+    @property
+    def busy(self):
+        """Есть ли невыполненные задачи."""
+        return self._pending > 0
+
+    def submit(self, key, func, on_done=None, on_error=None):
+        """
+        Постановка задачи в очередь с вытеснением задачи с тем же ключом.
+
+        Аргументы:
+            key (str): Ключ задачи
+            func (callable): Функция func(job), выполняемая в потоке
+            on_done (callable): Обработчик on_done(результат)
+            on_error (callable): Обработчик on_error(исключение)
+
+        Возвращает:
+            Job: Поставленная задача
+        """
+        previous = self._latest.get(key)
+        if previous is not None:
+            previous.cancel()
+
+        job = Job(self, key, func, on_done, on_error)
+        self._latest[key] = job
+        self._pending += 1
+        self._pool.submit(self._run, job)
+        self._schedule_poll()
+        return job
+
+    def cancel(self, key=None):
+        """Отмена задачи с заданным ключом или всех задач."""
+        for job_key, job in list(self._latest.items()):
+            if key is None or job_key == key:
+                job.cancel()
+                del self._latest[job_key]
+
+    def shutdown(self):
+        """Отмена задач и остановка рабочих потоков."""
+        self.cancel()
+        self._pool.shutdown(wait=False)
+
+    def post(self, job, kind, payload):
+        """Передача события задачи в главный поток."""
+        self._events.put((job, kind, payload))
+
+    def _run(self, job):
+        """Выполнение задачи в рабочем потоке."""
+        try:
+            # Вытесненная до начала задача не выполняется вовсе
+            job.check()
+            result = job.func(job)
+        except JobCancelled:
+            self.post(job, "cancelled", None)
+        except Exception as e:  # pylint: disable=broad-except
+            self.post(job, "error", e)
+        else:
+            self.post(job, "done", result)
+
+    def _schedule_poll(self):
+        """Запуск опроса очереди, если он еще не запущен."""
+        if not self._polling:
+            self._polling = True
+            self.widget.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        """
+        Доставка событий задач в главном потоке.
+
+        Исключение обработчика передается в
+        widget.report_callback_exception и не прерывает доставку
+        остальных событий.
+        """
+        try:
+            while True:
+                try:
+                    job, kind, payload = self._events.get_nowait()
+                except queue.Empty:
+                    break
+
+                if kind != "progress":
+                    self._pending -= 1
+                    if self._latest.get(job.key) is job:
+                        del self._latest[job.key]
+
+                # События вытесненных и отмененных задач не доставляются
+                if job.cancelled:
+                    continue
+                try:
+                    if kind == "progress" and self.on_progress is not None:
+                        self.on_progress(job, *payload)
+                    elif kind == "done" and job.on_done is not None:
+                        job.on_done(payload)
+                    elif kind == "error" and job.on_error is not None:
+                        job.on_error(payload)
+                except Exception:  # pylint: disable=broad-except
+                    self.widget.report_callback_exception(*sys.exc_info())
+        finally:
+            self._polling = False
+            if self._pending > 0:
+                self._schedule_poll()
@@ -0,0 +1,54 @@
+"""
+Отложенный импорт тяжелых модулей.
+
+OpenCV, NumPy и Pillow импортируются сотни миллисекунд, а на холодном
+диске - секунды. Модуль, объявленный через ``LazyModule``, загружается
+при первом обращении к его атрибуту, поэтому окно приложения
+появляется раньше, а загрузку можно выполнить заранее в фоне функцией
+``preload``.
+"""
+
+import importlib
+
+
+class LazyModule:
+    """Модуль, импортируемый при первом обращении к атрибуту."""
+
+    def __init__(self, name):
+        """
+        Аргументы:
+            name (str): Имя модуля
+        """
+        self._name = name
+        self._module = None
+
+    def load(self):
+        """
+        Импорт модуля (повторные вызовы возвращают уже загруженный).
+
+        Возвращает:
+            module: Загруженный модуль
+        """
+        if self._module is None:
+            # import_module потокобезопасен: второй поток дождется
+            # окончания импорта, начатого первым
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self):
+        """Загружен ли модуль."""
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = "загружен" if self.loaded else "не загружен"
+        return f"<LazyModule {self._name} ({state})>"
+
+
+def preload(*modules):
+    """Загрузка отложенных модулей (например, в фоновом потоке)."""
+    for module in modules:
+        module.load()
@@ -0,0 +1,321 @@
+"""
+Операции обработки изображений без привязки к интерфейсу.
+
+Все функции принимают массив NumPy в формате RGB (uint8, H x W x 3)
+и возвращают новый массив, не изменяя входной. Если передан ``dst`` -
+непрерывный массив той же формы, результат записывается в него без
+выделения памяти; ``dst`` может совпадать со входом (обработка на
+месте). Модуль используется как графическим приложением, так и
+пакетным режимом.
+"""
+
+from collections import Counter
+
+import cv2  # pylint: disable=import-error
+import numpy as np
+
+# Допустимые имена каналов для рецептов и их подписи в интерфейсе
+CHANNELS = {
+    "all": "Все",
+    "red": "Красный",
+    "green": "Зеленый",
+    "blue": "Синий",
+}
+CHANNEL_BY_LABEL = {label: name for name, label in CHANNELS.items()}
+
+# Индексы каналов в RGB-изображении
+CHANNEL_INDEX = {"red": 0, "green": 1, "blue": 2}
+
+LINE_COLOR = (0, 255, 0)  # Цвет линии (зеленый в RGB)
+
+
+def _copy_into(image, dst):
+    """Копия изображения в dst (или в новый массив, если dst - None)."""
+    if dst is None:
+        return image.copy()
+    if dst is not image:
+        np.copyto(dst, image)
+    return dst
+
+
+def apply_channel(image, channel, dst=None):
+    """
+    Оставляет в изображении только выбранный цветовой канал.
+
+    Аргументы:
+        image (np.ndarray): Исходное RGB-изображение
+        channel (str): Имя канала: all, red, green или blue
+        dst (np.ndarray): Массив для результата или None
+
+    Возвращает:
+        np.ndarray: RGB-изображение с результатом
+    """
+    channel = CHANNEL_BY_LABEL.get(channel, channel)
+    if channel == "all":
+        return _copy_into(image, dst)
+    if channel not in CHANNEL_INDEX:
+        raise ValueError(f"Неизвестный канал: {channel}")
+
+    index = CHANNEL_INDEX[channel]
+    if dst is None:
+        dst = np.zeros_like(image)
+        dst[..., index] = image[..., index]
+        return dst
+    if dst is not image:
+        dst[..., index] = image[..., index]
+    for other in CHANNEL_INDEX.values():
+        if other != index:
+            dst[..., other] = 0
+    return dst
+
+
+def adjust_brightness(image, value, dst=None):
+    """
+    Увеличение яркости через канал V пространства HSV.
+
+    Скаляр (0, 0, value) прибавляется прямо к HSV-буферу, поэтому,
+    кроме результата, память не выделяется.
+
+    Аргументы:
+        image (np.ndarray): Исходное RGB-изображение
+        value (int): Значение увеличения яркости (0-255)
+        dst (np.ndarray): Массив для результата или None
+
+    Возвращает:
+        np.ndarray: RGB-изображение с результатом
+    """
+    hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV, dst=dst)
+
+    # Сложение с насыщением: значения выше 255 - value становятся 255
+    cv2.add(hsv, (0, 0, value, 0), dst=hsv)
+
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB, dst=hsv)
+
+
+def convert_to_grayscale(image, dst=None):
+    """
+    Преобразование изображения в оттенки серого (три одинаковых канала).
+
+    Аргументы:
+        image (np.ndarray): Исходное RGB-изображение
+        dst (np.ndarray): Массив для результата или None
+
+    Возвращает:
+        np.ndarray: RGB-изображение с результатом
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB, dst=dst)
+
+
+def draw_line(image, start, end, thickness, color=LINE_COLOR, dst=None):
+    """
+    Рисование линии на копии изображения (или в dst).
+
+    Аргументы:
+        image (np.ndarray): Исходное RGB-изображение
+        start (tuple): Начальная точка (x, y)
+        end (tuple): Конечная точка (x, y)
+        thickness (int): Толщина линии
+        color (tuple): Цвет линии в RGB
+        dst (np.ndarray): Массив для результата или None
+
+    Возвращает:
+        np.ndarray: RGB-изображение с результатом
+    """
+    img = _copy_into(image, dst)
+    cv2.line(img, tuple(start), tuple(end), color, thickness)
+    return img
+
+
+def parse_recipe(text):
+    """
+    Разбор текстового рецепта в список операций.
+
+    Формат: операции через запятую, параметры после знака "=",
+    например ``channel=red,brightness=30,grayscale,line=0:0:99:99:3``.
+
+    Аргументы:
+        text (str): Текст рецепта
+
+    Возвращает:
+        list: Список кортежей (имя операции, параметры)
+    """
+    recipe = []
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, arg = item.partition("=")
+        name = name.strip().lower()
+
+        if name == "channel":
+            if arg not in CHANNELS:
+                raise ValueError(f"Неизвестный канал: {arg}")
+            recipe.append(("channel", {"channel": arg}))
+        elif name == "brightness":
+            value = int(arg)
+            if not 0 <= value <= 255:
+                raise ValueError(f"Недопустимая яркость: {value}")
+            recipe.append(("brightness", {"value": value}))
+        elif name == "grayscale":
+            recipe.append(("grayscale", {}))
+        elif name == "line":
+            parts = [int(part) for part in arg.split(":")]
+            if len(parts) != 5 or parts[4] < 1:
+                raise ValueError(
+                    f"Линия задается как x1:y1:x2:y2:толщина, получено {arg}"
+                )
+            recipe.append(("line", {
+                "start": (parts[0], parts[1]),
+                "end": (parts[2], parts[3]),
+                "thickness": parts[4],
+            }))
+        else:
+            raise ValueError(f"Неизвестная операция: {name}")
+    return recipe
+
+
+def format_recipe(recipe):
+    """
+    Запись рецепта в текст, обратная parse_recipe.
+
+    Аргументы:
+        recipe (list): Список кортежей (имя операции, параметры)
+
+    Возвращает:
+        str: Текст рецепта
+    """
+    items = []
+    for name, params in recipe:
+        if name == "channel":
+            channel = CHANNEL_BY_LABEL.get(params["channel"],
+                                           params["channel"])
+            items.append(f"channel={channel}")
+        elif name == "brightness":
+            items.append(f"brightness={params['value']}")
+        elif name == "grayscale":
+            items.append("grayscale")
+        elif name == "line":
+            coords = (*params["start"], *params["end"], params["thickness"])
+            items.append("line=" + ":".join(str(c) for c in coords))
+        else:
+            raise ValueError(f"Неизвестная операция: {name}")
+    return ",".join(items)
+
+
+def scale_params(name, params, scale):
+    """
+    Пересчет параметров операции для уменьшенной копии изображения.
+
+    Аргументы:
+        name (str): Имя операции
+        params (dict): Параметры для исходного размера
+        scale (float): Масштаб копии относительно исходного размера
+
+    Возвращает:
+        dict: Параметры для копии
+    """
+    if name != "line" or scale == 1:
+        return params
+    scaled = dict(params)
+    scaled["start"] = tuple(round(c * scale) for c in params["start"])
+    scaled["end"] = tuple(round(c * scale) for c in params["end"])
+    scaled["thickness"] = max(1, round(params["thickness"] * scale))
+    return scaled
+
+
+def apply_operation(image, name, params, dst=None):
+    """
+    Применение одной операции рецепта к изображению.
+
+    Аргументы:
+        image (np.ndarray): Исходное RGB-изображение
+        name (str): Имя операции
+        params (dict): Параметры операции
+        dst (np.ndarray): Массив для результата или None
+
+    Возвращает:
+        np.ndarray: RGB-изображение с результатом
+    """
+    if name == "channel":
+        return apply_channel(image, params["channel"], dst)
+    if name == "brightness":
+        return adjust_brightness(image, params["value"], dst)
+    if name == "grayscale":
+        return convert_to_grayscale(image, dst)
+    if name == "line":
+        return draw_line(image, params["start"], params["end"],
+                         params["thickness"],
+                         params.get("color", LINE_COLOR), dst)
+    raise ValueError(f"Неизвестная операция: {name}")
+
+
+def apply_recipe(image, recipe, dst=None):
+    """
+    Последовательное применение операций рецепта.
+
+    Первая операция пишет в dst (или в новый массив), остальные
+    выполняются на месте в том же буфере.
+
+    Аргументы:
+        image (np.ndarray): Исходное RGB-изображение
+        recipe (list): Список кортежей (имя операции, параметры)
+        dst (np.ndarray): Массив для результата или None; передача
+            самого image включает обработку на месте
+
+    Возвращает:
+        np.ndarray: Результирующее RGB-изображение
+    """
+    if not recipe:
+        return image if dst is None else _copy_into(image, dst)
+    for name, params in recipe:
+        image = dst = apply_operation(image, name, params, dst)
+    return image
+
+
+def changed_region(old_recipe, new_recipe):
+    """
+    Области изображения, в которых результаты двух рецептов могут
+    различаться.
+
+    Все операции, кроме линий, поточечные, поэтому если рецепты
+    отличаются только линиями, результаты различаются лишь в
+    прямоугольниках этих линий. Линия учитывается вместе с числом
+    поточечных операций перед ней: перенос линии через такую операцию
+    меняет ее цвет на результате.
+
+    Аргументы:
+        old_recipe (list): Прежний рецепт
+        new_recipe (list): Новый рецепт
+
+    Возвращает:
+        list: Прямоугольники (x0, y0, x1, y1) или None, если может
+            измениться все изображение
+    """
+    def split(recipe):
+        pointwise, lines = [], Counter()
+        for name, params in recipe:
+            if name != "line":
+                pointwise.append((name, params))
+                continue
+            lines[(len(pointwise), tuple(params["start"]),
+                   tuple(params["end"]), params["thickness"],
+                   tuple(params.get("color", LINE_COLOR)))] += 1
+        return pointwise, lines
+
+    old_pointwise, old_lines = split(old_recipe)
+    new_pointwise, new_lines = split(new_recipe)
+    if old_pointwise != new_pointwise:
+        return None
+    # Порядок перекрывающихся линий важен, только если цвета разные
+    if len({line[4] for line in old_lines + new_lines}) > 1:
+        return None
+
+    regions = []
+    for _, start, end, thickness, _ in (old_lines - new_lines) + \
+            (new_lines - old_lines):
+        regions.append((min(start[0], end[0]) - thickness,
+                        min(start[1], end[1]) - thickness,
+                        max(start[0], end[0]) + thickness + 1,
+                        max(start[1], end[1]) + thickness + 1))
+    return regions
@@ -0,0 +1,57 @@
+"""
+Пирамида уменьшенных копий изображения для быстрого предпросмотра.
+
+Уровень 0 - исходное изображение, каждый следующий уровень вдвое меньше
+предыдущего по обеим сторонам. Операции предпросмотра выполняются на
+наименьшем уровне, которого еще достаточно для отображения.
+"""
+
+import cv2  # pylint: disable=import-error
+
+MIN_LEVEL_SIZE = 256  # Уровни меньше этого размера не строятся
+
+
+def build_pyramid(image, min_size=MIN_LEVEL_SIZE):
+    """
+    Построение пирамиды уменьшенных копий.
+
+    Аргументы:
+        image (np.ndarray): Исходное изображение
+        min_size (int): Минимальная длина большей стороны уровня
+
+    Возвращает:
+        list: Уровни от исходного изображения к самому маленькому
+    """
+    levels = [image]
+    while max(levels[-1].shape[:2]) // 2 >= min_size:
+        height, width = levels[-1].shape[:2]
+        level = cv2.resize(
+            levels[-1], (width // 2, height // 2),
+            interpolation=cv2.INTER_AREA
+        )
+        level.flags.writeable = False
+        levels.append(level)
+    return levels
+
+
+def select_level(levels, target_size):
+    """
+    Выбор наименьшего уровня, большая сторона которого не меньше
+    требуемой.
+
+    Аргументы:
+        levels (list): Уровни пирамиды
+        target_size (int): Требуемая длина большей стороны
+
+    Возвращает:
+        int: Индекс уровня
+    """
+    for index in range(len(levels) - 1, 0, -1):
+        if max(levels[index].shape[:2]) >= target_size:
+            return index
+    return 0
+
+
+def level_scale(levels, index):
+    """Масштаб уровня относительно исходного изображения."""
+    return levels[index].shape[1] / levels[0].shape[1]
@@ -0,0 +1,674 @@
+"""
+Локальный HTTP-сервис обработки изображений.
+
+Сервер на asyncio принимает изображение (PNG, JPEG и т.д. или сырые
+RGB-байты) и рецепт в том же текстовом формате, что и пакетный режим,
+и возвращает результат. Обработка выполняется в пуле рабочих потоков
+(OpenCV освобождает GIL). Небольшие сырые изображения с одинаковыми
+рецептом и размером собираются в пакеты и обрабатываются одной
+стопкой в одной задаче пула.
+Очередь запросов ограничена: при переполнении сервер сразу отвечает
+503, а не накапливает задержку. Счетчики задержки и пропускной
+способности доступны по GET /stats.
+
+Пример:
+    python -m server --port 8080
+    python -m server --unix /tmp/imgproc.sock
+    curl --data-binary @in.jpg -o out.png \\
+        "http://127.0.0.1:8080/process?recipe=grayscale,brightness=30"
+    curl --data-binary @frame.rgb -o out.rgb \\
+        "http://127.0.0.1:8080/process?recipe=channel=red&shape=480x640&format=raw"
+    python -m server --load-test --requests 2000 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, quote, urlsplit
+
+import cv2  # pylint: disable=import-error
+import numpy as np
+
+import buffers
+import fusion
+import operations
+import stacked
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_QUEUE_SIZE = 64       # Запросов в очереди до ответа 503
+DEFAULT_MAX_BATCH = 16        # Запросов в одном пакете
+DEFAULT_BATCH_WINDOW = 0.005  # Ожидание попутных запросов, с
+SMALL_PIXELS = 512 * 512      # Пакетируемый размер сырого изображения, пикс.
+MAX_BODY = 256 * 1024 * 1024  # Наибольший размер тела запроса, байт
+LATENCY_SAMPLES = 4096        # Число хранимых задержек для перцентилей
+THROUGHPUT_WINDOW = 10.0      # Окно расчета текущей пропускной способности, с
+
+FORMATS = {"png": ".png", "jpg": ".jpg", "jpeg": ".jpg", "webp": ".webp",
+           "bmp": ".bmp", "raw": None}
+CONTENT_TYPES = {".png": "image/png", ".jpg": "image/jpeg",
+                 ".webp": "image/webp", ".bmp": "image/bmp",
+                 None: "application/octet-stream"}
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 411: "Length Required",
+           413: "Payload Too Large", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+# Пул промежуточных буферов рабочих потоков
+_POOL = buffers.BufferPool()
+
+
+class HTTPError(Exception):
+    """Ошибка запроса с кодом ответа HTTP."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_shape(text):
+    """Разбор размера вида ВЫСОТАxШИРИНА."""
+    height, _, width = text.lower().partition("x")
+    try:
+        height, width = int(height), int(width)
+    except ValueError:
+        raise HTTPError(400, f"Некорректный размер: {text}") from None
+    if height <= 0 or width <= 0:
+        raise HTTPError(400, f"Некорректный размер: {text}")
+    return height, width
+
+
+def process_one(body, shape, recipe, extension):
+    """
+    Обработка одного запроса в рабочем потоке.
+
+    Аргументы:
+        body (bytes): Сжатое изображение или сырые RGB-байты
+        shape (tuple): (высота, ширина) для сырых данных или None
+        recipe (list): Разобранный рецепт
+        extension (str): Расширение выходного формата или None для
+            сырых RGB-байтов
+
+    Возвращает:
+        bytes: Результат
+
+    Исключения:
+        HTTPError: Изображение не удалось декодировать или закодировать
+    """
+    if shape is None:
+        image = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise HTTPError(400, "Не удалось декодировать изображение")
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+        result = fusion.apply_recipe(image, recipe, dst=image, pool=_POOL)
+    else:
+        # Буфер тела только для чтения: результат пишется в новый массив
+        image = np.frombuffer(body, np.uint8).reshape(shape + (3,))
+        result = fusion.apply_recipe(image, recipe, pool=_POOL)
+    return encode_result(result, extension)
+
+
+def encode_result(result, extension):
+    """
+    Кодирование результата (массив может быть изменен).
+
+    Аргументы:
+        result (np.ndarray): RGB-изображение
+        extension (str): Расширение выходного формата или None для
+            сырых RGB-байтов
+
+    Возвращает:
+        bytes: Закодированный результат
+
+    Исключения:
+        HTTPError: Изображение не удалось закодировать
+    """
+    if extension is None:
+        return result.tobytes()
+    ok, encoded = cv2.imencode(
+        extension, cv2.cvtColor(result, cv2.COLOR_RGB2BGR, dst=result))
+    if not ok:
+        raise HTTPError(500, f"Не удалось закодировать {extension}")
+    return encoded.tobytes()
+
+
+def process_batch(jobs):
+    """
+    Обработка пакета запросов одной задачей пула.
+
+    В пакете собираются запросы с одинаковым ключом (рецепт, размер,
+    формат), поэтому сырые изображения пакета обрабатываются одной
+    стопкой (модуль stacked).
+
+    Аргументы:
+        jobs (list): Аргументы process_one для каждого запроса
+
+    Возвращает:
+        list: Результат или исключение для каждого запроса
+    """
+    _, shape, recipe, extension = jobs[0]
+    if len(jobs) > 1 and shape is not None:
+        stack = np.empty((len(jobs),) + shape + (3,), dtype=np.uint8)
+        for item, job in zip(stack, jobs):
+            item[...] = np.frombuffer(job[0], np.uint8).reshape(item.shape)
+        stacked.apply_recipe_stack(stack, recipe, dst=stack, pool=_POOL)
+        results = []
+        for item in stack:
+            try:
+                results.append(encode_result(item, extension))
+            except Exception as e:  # pylint: disable=broad-except
+                results.append(e)
+        return results
+
+    results = []
+    for job in jobs:
+        try:
+            results.append(process_one(*job))
+        except Exception as e:  # pylint: disable=broad-except
+            results.append(e)
+    return results
+
+
+class _Pending:
+    """Запрос в очереди."""
+
+    __slots__ = ("key", "job", "future", "enqueued")
+
+    def __init__(self, key, job, future, enqueued):
+        self.key = key
+        self.job = job
+        self.future = future
+        self.enqueued = enqueued
+
+
+class Stats:
+    """Счетчики запросов, задержки и пропускной способности."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0       # Принято запросов на обработку
+        self.completed = 0      # Успешно обработано
+        self.errors = 0         # Завершено с ошибкой
+        self.rejected = 0       # Отклонено из-за переполнения очереди
+        self.batches = 0        # Выполнено пакетов
+        self.batched = 0        # Запросов в выполненных пакетах
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.finished = deque()  # Моменты завершения для окна
+
+    def record(self, latency, ok):
+        """Учет завершенного запроса."""
+        now = time.monotonic()
+        if ok:
+            self.completed += 1
+        else:
+            self.errors += 1
+        self.latencies.append(latency)
+        self.finished.append(now)
+        while self.finished and self.finished[0] < now - THROUGHPUT_WINDOW:
+            self.finished.popleft()
+
+    def snapshot(self, queue_depth, in_flight):
+        """Счетчики в виде словаря для JSON."""
+        now = time.monotonic()
+        uptime = now - self.started
+        recent = sum(1 for moment in self.finished
+                     if moment >= now - THROUGHPUT_WINDOW)
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            index = min(len(latencies) - 1, int(fraction * len(latencies)))
+            return round(latencies[index] * 1000, 3)
+
+        return {
+            "uptime_s": round(uptime, 3),
+            "requests": self.requests,
+            "completed": self.completed,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "in_flight": in_flight,
+            "queue_depth": queue_depth,
+            "batches": self.batches,
+            "mean_batch_size": round(self.batched / self.batches, 3)
+            if self.batches else None,
+            "latency_ms": {
+                "mean": round(statistics.fmean(latencies) * 1000, 3)
+                if latencies else None,
+                "p50": percentile(0.50),
+                "p90": percentile(0.90),
+                "p99": percentile(0.99),
+                "max": percentile(1.0),
+            },
+            "throughput_rps": round(
+                recent / min(THROUGHPUT_WINDOW, uptime), 3)
+            if uptime > 0 else 0.0,
+            "throughput_total_rps": round(self.completed / uptime, 3)
+            if uptime > 0 else 0.0,
+        }
+
+
+class ImageService:
+    """Сервис обработки с пакетированием и ограниченной очередью."""
+
+    def __init__(self, workers=None, queue_size=DEFAULT_QUEUE_SIZE,
+                 max_batch=DEFAULT_MAX_BATCH,
+                 batch_window=DEFAULT_BATCH_WINDOW):
+        """
+        Аргументы:
+            workers (int): Число рабочих потоков (по умолчанию - по
+                числу ядер)
+            queue_size (int): Наибольшее число запросов в очереди
+            max_batch (int): Наибольшее число запросов в пакете
+            batch_window (float): Время ожидания попутных запросов, с
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.stats = Stats()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                           thread_name_prefix="server")
+        self.queue = None
+        self._slots = None
+        self._dispatcher = None
+        self._in_flight = 0
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                    unix_path=None):
+        """
+        Запуск сервера (TCP или Unix-сокет) и распределителя пакетов.
+
+        Возвращает:
+            asyncio.AbstractServer: Запущенный сервер
+        """
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        # Пакетов в работе не больше, чем рабочих потоков: пока все
+        # заняты, очередь заполняется и новые запросы получают 503
+        self._slots = asyncio.Semaphore(self.workers)
+        self._dispatcher = asyncio.ensure_future(self._dispatch())
+        if unix_path is not None:
+            return await asyncio.start_unix_server(self.handle, unix_path)
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        """Остановка распределителя и пула."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def process(self, body, query):
+        """
+        Постановка запроса в очередь и ожидание результата.
+
+        Аргументы:
+            body (bytes): Тело запроса
+            query (dict): Параметры запроса (результат parse_qs)
+
+        Возвращает:
+            tuple: (результат, тип содержимого)
+        """
+        def param(name, default=None):
+            return query.get(name, [default])[0]
+
+        recipe_text = param("recipe", "")
+        try:
+            recipe = operations.parse_recipe(recipe_text) \
+                if recipe_text else []
+        except ValueError as e:
+            raise HTTPError(400, f"Некорректный рецепт: {e}") from None
+
+        output = param("format", "png").lower()
+        if output not in FORMATS:
+            raise HTTPError(400, f"Неизвестный формат: {output}")
+        extension = FORMATS[output]
+
+        shape = param("shape")
+        key = None
+        if shape is not None:
+            shape = parse_shape(shape)
+            if len(body) != shape[0] * shape[1] * 3:
+                raise HTTPError(400, "Размер данных не совпадает с shape")
+            # Пакетируются только небольшие сырые изображения с
+            # одинаковыми рецептом, размером и форматом результата:
+            # их можно сложить в стопку. Сжатые изображения
+            # обрабатываются по одному, параллельно в разных потоках
+            if shape[0] * shape[1] <= SMALL_PIXELS:
+                key = (recipe_text, shape, extension)
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait(_Pending(
+                key, (body, shape, recipe, extension), future,
+                time.monotonic()))
+        except asyncio.QueueFull:
+            self.stats.rejected += 1
+            raise HTTPError(503, "Сервер перегружен, повторите позже") \
+                from None
+
+        self.stats.requests += 1
+        self._in_flight += 1
+        try:
+            return await future, CONTENT_TYPES[extension]
+        finally:
+            self._in_flight -= 1
+
+    async def _dispatch(self):
+        """
+        Сбор запросов из очереди в пакеты и передача их в пул.
+
+        Перед отправкой пакетов из очереди забираются все ожидающие
+        запросы, поэтому при накопившейся очереди пакеты получаются
+        полными. Окно ожидания попутных запросов отсчитывается от
+        создания пакета, а не от постановки запроса в очередь.
+        """
+        loop = asyncio.get_running_loop()
+        buckets = {}  # Ключ -> (момент создания, запросы)
+        getter = None
+        while True:
+            timeout = None
+            if buckets:
+                oldest = min(created for created, _ in buckets.values())
+                timeout = max(0.0, oldest + self.batch_window -
+                              time.monotonic())
+            if getter is None:
+                getter = asyncio.ensure_future(self.queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            ready = []
+            arrived = []
+            if done:
+                arrived.append(getter.result())
+                getter = None
+                while True:
+                    try:
+                        arrived.append(self.queue.get_nowait())
+                    except asyncio.QueueEmpty:
+                        break
+
+            now = time.monotonic()
+            for item in arrived:
+                if item.key is None:
+                    ready.append([item])
+                    continue
+                bucket = buckets.setdefault(item.key, (now, []))[1]
+                bucket.append(item)
+                if len(bucket) >= self.max_batch:
+                    ready.append(buckets.pop(item.key)[1])
+
+            for key, (created, items) in list(buckets.items()):
+                if now - created >= self.batch_window:
+                    ready.append(items)
+                    del buckets[key]
+
+            for items in ready:
+                # Ожидание свободного потока - источник обратного давления
+                await self._slots.acquire()
+                loop.create_task(self._run_batch(items))
+
+    async def _run_batch(self, items):
+        """Выполнение пакета в пуле и доставка результатов."""
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                self.executor, process_batch, [item.job for item in items])
+        except Exception as e:  # pylint: disable=broad-except
+            results = [e] * len(items)
+        finally:
+            self._slots.release()
+
+        self.stats.batches += 1
+        self.stats.batched += len(items)
+        now = time.monotonic()
+        for item, result in zip(items, results):
+            ok = not isinstance(result, Exception)
+            self.stats.record(now - item.enqueued, ok)
+            if item.future.done():
+                continue
+            if ok:
+                item.future.set_result(result)
+            else:
+                item.future.set_exception(result)
+
+    async def handle(self, reader, writer):
+        """Обработка соединения (поддерживается keep-alive)."""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    await write_response(writer, e.status,
+                                         str(e).encode("utf-8"),
+                                         "text/plain; charset=utf-8",
+                                         keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload, content_type = await self.route(
+                    method, target, body)
+                await write_response(writer, status, payload, content_type,
+                                     keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, target, body):
+        """
+        Выполнение запроса.
+
+        Возвращает:
+            tuple: (код ответа, тело, тип содержимого)
+        """
+        url = urlsplit(target)
+        try:
+            if url.path == "/health":
+                return 200, b"ok", "text/plain"
+            if url.path == "/stats":
+                stats = self.stats.snapshot(self.queue.qsize(),
+                                            self._in_flight)
+                return (200, json.dumps(stats, ensure_ascii=False).encode(),
+                        "application/json")
+            if url.path == "/process":
+                if method != "POST":
+                    raise HTTPError(405, "Используйте POST")
+                payload, content_type = await self.process(
+                    body, parse_qs(url.query))
+                return 200, payload, content_type
+            raise HTTPError(404, f"Неизвестный путь: {url.path}")
+        except HTTPError as e:
+            return (e.status, str(e).encode("utf-8"),
+                    "text/plain; charset=utf-8")
+        except Exception as e:  # pylint: disable=broad-except
+            return 500, str(e).encode("utf-8"), "text/plain; charset=utf-8"
+
+
+async def read_request(reader):
+    """
+    Чтение одного HTTP-запроса.
+
+    Возвращает:
+        tuple: (метод, цель, заголовки, тело) или None, если соединение
+            закрыто
+
+    Исключения:
+        HTTPError: Некорректный запрос
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "Некорректная строка запроса") from None
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    body = b""
+    if method == "POST":
+        if "content-length" not in headers:
+            raise HTTPError(411, "Нужен заголовок Content-Length")
+        text = headers["content-length"]
+        if not (text.isascii() and text.isdigit()):
+            raise HTTPError(400, f"Некорректный Content-Length: {text}")
+        length = int(text)
+        if length > MAX_BODY:
+            raise HTTPError(413, "Слишком большое тело запроса")
+        body = await reader.readexactly(length)
+    return method, target, headers, body
+
+
+async def write_response(writer, status, body, content_type,
+                         keep_alive=True):
+    """Отправка HTTP-ответа."""
+    head = (
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+    )
+    if status == 503:
+        head += "Retry-After: 1\r\n"
+    writer.write(head.encode("latin-1") + b"\r\n")
+    writer.write(body)
+    await writer.drain()
+
+
+async def serve(args):
+    """Запуск сервера до прерывания."""
+    service = ImageService(args.workers, args.queue_size, args.max_batch,
+                           args.batch_window / 1000)
+    server = await service.start(args.host, args.port, args.unix)
+    where = args.unix or f"http://{args.host}:{args.port}"
+    print(f"Сервер запущен: {where} (потоков: {service.workers})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+async def load_test(args):
+    """
+    Нагрузочный тест запущенного сервера.
+
+    Отправляет args.requests запросов с сырым изображением args.size
+    через args.concurrency соединений и печатает пропускную способность,
+    перцентили задержки и число отказов.
+    """
+    height, width = parse_shape(args.size)
+    body = np.random.default_rng(0).integers(
+        0, 256, (height, width, 3), dtype=np.uint8).tobytes()
+    target = (f"/process?recipe={quote(args.recipe)}"
+              f"&shape={height}x{width}&format=raw")
+    request = (f"POST {target} HTTP/1.1\r\nHost: localhost\r\n"
+               f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+    latencies, statuses = [], {}
+    remaining = [args.requests]
+
+    async def client():
+        if args.unix:
+            reader, writer = await asyncio.open_unix_connection(args.unix)
+        else:
+            reader, writer = await asyncio.open_connection(args.host,
+                                                           args.port)
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            started = time.perf_counter()
+            writer.write(request)
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line == b"\r\n":
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(time.perf_counter() - started)
+            elif status == 503:
+                await asyncio.sleep(0.001)
+        writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    print(f"Запросов: {args.requests} за {elapsed:.2f} с, "
+          f"коды ответов: {statuses}")
+    if latencies:
+        print(f"Пропускная способность: {len(latencies) / elapsed:.1f} "
+              f"запросов/с")
+        for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+            index = min(len(latencies) - 1, int(fraction * len(latencies)))
+            print(f"Задержка {name}: {latencies[index] * 1000:.1f} мс")
+    return 0 if statuses.get(200) else 1
+
+
+def main(argv=None):
+    """Точка входа командной строки."""
+    parser = argparse.ArgumentParser(
+        prog="python -m server",
+        description="HTTP-сервис обработки изображений"
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help="Адрес для прослушивания")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="Порт")
+    parser.add_argument("--unix", default=None,
+                        help="Путь к Unix-сокету вместо TCP")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Число рабочих потоков (по умолчанию - "
+                             "по числу ядер)")
+    parser.add_argument("--queue-size", type=int,
+                        default=DEFAULT_QUEUE_SIZE,
+                        help="Наибольшее число запросов в очереди")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH,
+                        help="Наибольшее число запросов в пакете")
+    parser.add_argument("--batch-window", type=float,
+                        default=DEFAULT_BATCH_WINDOW * 1000,
+                        help="Ожидание попутных запросов, мс")
+    parser.add_argument("--load-test", action="store_true",
+                        help="Нагрузочный тест запущенного сервера")
+    parser.add_argument("--requests", type=int, default=1000,
+                        help="Число запросов нагрузочного теста")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="Число одновременных соединений теста")
+    parser.add_argument("--size", default="256x256",
+                        help="Размер изображения теста ВЫСОТАxШИРИНА")
+    parser.add_argument("--recipe", default="brightness=30,grayscale",
+                        help="Рецепт для нагрузочного теста")
+    args = parser.parse_args(argv)
+
+    if args.load_test:
+        return asyncio.run(load_test(args))
+
+    # Параллелизм обеспечивает пул потоков; внутренние потоки OpenCV
+    # на каждом вызове только мешали бы ему
+    cv2.setNumThreads(1)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
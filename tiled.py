@@ -0,0 +1,267 @@
+"""
+Потоковая обработка очень больших изображений по тайлам.
+
+Изображение читается из файла, отображенного в память (.npy или сырые
+RGB-данные), тайлами фиксированного размера. К каждому тайлу применяется
+рецепт операций, результат сразу записывается в выходной файл, также
+отображенный в память. Пиковое потребление памяти определяется размером
+тайла, а не размером изображения.
+
+Сжатые форматы (JPEG, PNG) нельзя декодировать по частям средствами
+OpenCV, поэтому они один раз декодируются во временный .npy-файл.
+
+Пример:
+    python -m tiled scan.npy "brightness=30,line=0:0:90000:60000:40" out.npy
+    python -m tiled scan.raw grayscale out.raw --shape 60000x90000
+"""
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+
+import cv2  # pylint: disable=import-error
+import numpy as np
+
+import annotations
+import buffers
+import fusion
+import operations
+
+DEFAULT_TILE_SIZE = 1024   # Сторона тайла по умолчанию, пикселей
+# Число копий тайла, одновременно живущих при выполнении рецепта:
+# тайл обрабатывается на месте, плюс скалярные плоскости операций
+WORKING_COPIES = 2
+TILE_ALIGNMENT = 64        # Кратность стороны тайла, пикселей
+RAW_EXTENSIONS = (".raw", ".rgb")
+
+
+def open_source(path, shape=None):
+    """
+    Открытие исходного изображения без чтения его в память.
+
+    Аргументы:
+        path (str): Путь к .npy, сырому RGB-файлу или сжатому изображению
+        shape (tuple): (высота, ширина) для сырого файла
+
+    Возвращает:
+        tuple: (массив RGB только для чтения, путь к временному файлу
+        или None)
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        return np.load(path, mmap_mode="r"), None
+    if extension in RAW_EXTENSIONS:
+        if shape is None:
+            raise ValueError("Для сырого файла нужно указать размер")
+        return np.memmap(path, dtype=np.uint8, mode="r",
+                         shape=(shape[0], shape[1], 3)), None
+
+    # Сжатый формат декодируется целиком один раз
+    image = cv2.imread(path)
+    if image is None:
+        raise ValueError(f"Не удалось загрузить изображение: {path}")
+    handle, temp_path = tempfile.mkstemp(suffix=".npy")
+    os.close(handle)
+    backing = np.lib.format.open_memmap(temp_path, mode="w+",
+                                        dtype=np.uint8, shape=image.shape)
+    for y in range(0, image.shape[0], DEFAULT_TILE_SIZE):
+        strip = image[y:y + DEFAULT_TILE_SIZE]
+        cv2.cvtColor(strip, cv2.COLOR_BGR2RGB,
+                     dst=backing[y:y + DEFAULT_TILE_SIZE])
+    backing.flush()
+    del image, backing
+    return np.load(temp_path, mmap_mode="r"), temp_path
+
+
+def create_output(path, shape):
+    """
+    Создание выходного файла, отображенного в память.
+
+    Аргументы:
+        path (str): Путь к .npy или сырому файлу
+        shape (tuple): Форма изображения (высота, ширина, 3)
+
+    Возвращает:
+        np.memmap: Массив для записи результата
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        return np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8,
+                                         shape=shape)
+    if extension in RAW_EXTENSIONS:
+        return np.memmap(path, dtype=np.uint8, mode="w+", shape=shape)
+    raise ValueError(
+        "Потоковая запись поддерживается только для .npy и .raw/.rgb"
+    )
+
+
+def tile_size_for_budget(budget):
+    """
+    Сторона тайла, при которой рабочие копии укладываются в бюджет.
+
+    Аргументы:
+        budget (int): Бюджет памяти, байт
+
+    Возвращает:
+        int: Сторона тайла, пикселей
+    """
+    side = int(math.sqrt(budget / (3 * WORKING_COPIES)))
+    if side < TILE_ALIGNMENT:
+        raise ValueError("Бюджет памяти слишком мал для обработки тайлами")
+    return side // TILE_ALIGNMENT * TILE_ALIGNMENT
+
+
+def iter_tiles(height, width, tile_size):
+    """Перебор тайлов изображения как (y, x, высота, ширина)."""
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            yield y, x, min(tile_size, height - y), min(tile_size, width - x)
+
+
+def split_stages(stages):
+    """
+    Разбиение скомпилированного рецепта на группы.
+
+    Возвращает:
+        list: Пары (True, слои линий) для слоев annotations.LineLayer и
+        (False, стадии) для остальных подряд идущих стадий
+    """
+    groups = []
+    for stage in stages:
+        is_line = isinstance(stage, annotations.LineLayer)
+        if groups and groups[-1][0] == is_line:
+            groups[-1][1].append(stage)
+        else:
+            groups.append((is_line, [stage]))
+    return groups
+
+
+def _tiled_pass(source, stages, output, tile_size, progress, pool):
+    """
+    Один проход тайлами: чтение, обработка и запись результата.
+
+    Тайл читается в буфер из пула и обрабатывается в нем на месте,
+    поэтому проход не выделяет память на каждый тайл.
+    """
+    height, width = source.shape[:2]
+    total = math.ceil(height / tile_size) * math.ceil(width / tile_size)
+    shape = None
+    for done, (y, x, tile_h, tile_w) in enumerate(
+            iter_tiles(height, width, tile_size), start=1):
+        # Буферы краевых тайлов не копятся рядом с основными
+        if (tile_h, tile_w) != shape:
+            pool.clear()
+            shape = (tile_h, tile_w)
+        with pool.borrow((tile_h, tile_w) + source.shape[2:],
+                         source.dtype) as tile:
+            np.copyto(tile, source[y:y + tile_h, x:x + tile_w])
+            output[y:y + tile_h, x:x + tile_w] = \
+                fusion.run_compiled(tile, stages, dst=tile, pool=pool)
+        if progress is not None:
+            progress(done, total)
+
+
+def process_tiled(source, recipe, output, tile_size=DEFAULT_TILE_SIZE,
+                  progress=None):
+    """
+    Применение рецепта к изображению по тайлам.
+
+    Поточечные операции выполняются проходами по тайлам. Линии
+    рисуются прямо в выходной файл в координатах всего изображения:
+    растеризация cv2.line зависит от отсечения по границам холста, и
+    рисование по тайлам (даже с перекрытием) сдвигает пиксели линии.
+    Запись в отображенный файл затрагивает только страницы вдоль
+    линии, поэтому память остается ограниченной.
+
+    Аргументы:
+        source (np.ndarray): Исходное RGB-изображение (обычно memmap)
+        recipe (list): Список кортежей (имя операции, параметры)
+        output (np.ndarray): Массив для результата той же формы
+        tile_size (int): Сторона тайла, пикселей
+        progress (callable): Функция progress(готово, всего) или None
+    """
+    # Преобразование HSV в OpenCV дает разный результат в векторной
+    # части строки и в ее хвосте, поэтому границы тайлов по X
+    # выравниваются, чтобы разбиение строк совпадало с целым кадром
+    tile_size = max(TILE_ALIGNMENT,
+                    tile_size // TILE_ALIGNMENT * TILE_ALIGNMENT)
+
+    pool = buffers.BufferPool(max_free=1)
+    current = source
+    for is_line, stages in split_stages(fusion.compile_recipe(recipe)):
+        if is_line:
+            if current is source:
+                _tiled_pass(source, [], output, tile_size, progress, pool)
+                current = output
+            for layer in stages:
+                layer.rasterize(output, dst=output)
+        else:
+            _tiled_pass(current, stages, output, tile_size, progress,
+                        pool)
+            current = output
+
+    if current is source:
+        _tiled_pass(source, [], output, tile_size, progress, pool)
+    if hasattr(output, "flush"):
+        output.flush()
+
+
+def _parse_shape(text):
+    """Разбор размера вида ВЫСОТАxШИРИНА."""
+    height, _, width = text.lower().partition("x")
+    return int(height), int(width)
+
+
+def main(argv=None):
+    """Точка входа командной строки."""
+    parser = argparse.ArgumentParser(
+        prog="python -m tiled",
+        description="Обработка больших изображений тайлами"
+    )
+    parser.add_argument("input", help="Файл .npy, .raw/.rgb или JPEG/PNG")
+    parser.add_argument("recipe", help="Рецепт, как в python -m batch")
+    parser.add_argument("output", help="Выходной файл .npy или .raw/.rgb")
+    parser.add_argument("--shape", type=_parse_shape, default=None,
+                        help="Размер сырого файла, ВЫСОТАxШИРИНА")
+    parser.add_argument("--tile-size", type=int, default=None,
+                        help="Сторона тайла, пикселей")
+    parser.add_argument("--memory-budget", type=int, default=None,
+                        help="Бюджет памяти на тайлы, МБ")
+    args = parser.parse_args(argv)
+
+    try:
+        recipe = operations.parse_recipe(args.recipe)
+        if args.tile_size is not None:
+            tile_size = args.tile_size
+        elif args.memory_budget is not None:
+            tile_size = tile_size_for_budget(
+                args.memory_budget * 1024 * 1024)
+        else:
+            tile_size = DEFAULT_TILE_SIZE
+        source, temp_path = open_source(args.input, args.shape)
+    except ValueError as e:
+        parser.error(str(e))
+
+    started = time.perf_counter()
+    try:
+        output = create_output(args.output, source.shape)
+        process_tiled(source, recipe, output, tile_size)
+    except ValueError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    finally:
+        del source
+        if temp_path is not None:
+            os.remove(temp_path)
+    elapsed = time.perf_counter() - started
+
+    print(f"Обработано {args.output} тайлами {tile_size}px "
+          f"за {elapsed:.2f} с")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
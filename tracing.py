@@ -0,0 +1,157 @@
+"""
+Легковесная трассировка этапов обработки.
+
+Этапы оборачиваются в ``with tracing.span("имя") as span:``. Пока
+трассировка выключена, span возвращает общий пустой объект, и накладные
+расходы сводятся к одной проверке флага. Во включенном состоянии для
+каждого этапа сохраняются длительность, поток, а также форма и размер
+результата, если он передан в ``span.record``. События экспортируются
+в формат Chrome trace-event (chrome://tracing, Perfetto).
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+MAX_EVENTS = 100000  # Число хранимых событий
+
+
+class _NullSpan:
+    """Пустой этап для выключенной трассировки."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def record(self, image):
+        """Ничего не записывает; возвращает изображение."""
+        return image
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """Измеряемый этап."""
+
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.add(self, time.perf_counter_ns())
+        return False
+
+    def record(self, image):
+        """
+        Запись формы и размера результата этапа.
+
+        Аргументы:
+            image (np.ndarray): Результат этапа
+
+        Возвращает:
+            np.ndarray: То же изображение
+        """
+        if image is not None:
+            self.args["shape"] = list(image.shape)
+            self.args["result_bytes"] = int(image.nbytes)
+        return image
+
+
+class Tracer:
+    """Хранилище событий трассировки."""
+
+    def __init__(self, max_events=MAX_EVENTS):
+        """
+        Аргументы:
+            max_events (int): Число хранимых событий
+        """
+        self.enabled = False
+        self.events = deque(maxlen=max_events)
+        self.last = {}   # Имя этапа -> последняя длительность, мс
+
+    def span(self, name, **args):
+        """Новый этап или пустой этап, если трассировка выключена."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, args)
+
+    def add(self, span, end):
+        """Сохранение завершенного этапа."""
+        duration = end - span.start
+        self.events.append((span.name, span.start, duration,
+                            threading.get_ident(), span.args))
+        self.last[span.name] = duration / 1e6
+
+    def clear(self):
+        """Удаление всех событий."""
+        self.events.clear()
+        self.last.clear()
+
+    def summary(self, names):
+        """
+        Строка с последними длительностями этапов.
+
+        Аргументы:
+            names (list): Имена этапов в порядке вывода
+
+        Возвращает:
+            str: Например ``decode 120.0 мс | photo 3.1 мс``
+        """
+        return " | ".join(
+            f"{name} {self.last[name]:.1f} мс"
+            for name in names if name in self.last
+        )
+
+    def export_chrome(self, path):
+        """
+        Экспорт событий в формате Chrome trace-event JSON.
+
+        Аргументы:
+            path (str): Путь к файлу
+        """
+        pid = os.getpid()
+        events = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": start / 1000,
+                "dur": duration / 1000,
+                "pid": pid,
+                "tid": tid,
+                "args": args,
+            }
+            for name, start, duration, tid, args in list(self.events)
+        ]
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": events,
+                       "displayTimeUnit": "ms"}, file)
+
+
+TRACER = Tracer()
+
+
+def span(name, **args):
+    """Этап глобального трассировщика."""
+    if not TRACER.enabled:
+        return _NULL_SPAN
+    return Span(TRACER, name, args)
+
+
+def set_enabled(enabled):
+    """Включение и выключение глобальной трассировки."""
+    TRACER.enabled = enabled
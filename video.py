@@ -0,0 +1,381 @@
+"""
+Потоковая обработка видеофайлов рецептом операций.
+
+Обработка построена как конвейер из трех стадий: поток декодирования
+(cv2.VideoCapture) -> пул рабочих потоков, применяющих рецепт ->
+поток кодирования (cv2.VideoWriter), записывающий кадры в исходном
+порядке. Стадии связаны очередями ограниченного размера, а буферы
+кадров берутся из пула и возвращаются в него после записи, поэтому
+потребление памяти не зависит от длины видео. OpenCV освобождает GIL,
+так что рабочие потоки обрабатывают кадры параллельно на всех ядрах.
+
+Пример:
+    python -m video input.mp4 "brightness=30,grayscale" output.mp4
+    python -m video in.avi "channel=red,line=0:0:639:479:3" out.avi --workers 8
+"""
+
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+
+import cv2  # pylint: disable=import-error
+
+import buffers
+import fusion
+import operations
+import tracing
+
+DEFAULT_QUEUE_SIZE = 8    # Кадров в каждой очереди между стадиями
+DEFAULT_FPS = 25.0        # Частота кадров, если файл ее не сообщает
+PUT_TIMEOUT = 0.1         # Период проверки остановки при ожидании, с
+# Кодек по расширению выходного файла
+FOURCC = {".mp4": "mp4v", ".m4v": "mp4v", ".mov": "mp4v", ".avi": "MJPG",
+          ".mkv": "XVID"}
+DEFAULT_FOURCC = "mp4v"
+
+_END = None  # Признак конца потока кадров в очередях
+
+
+class PipelineStats:
+    """Счетчики конвейера: кадры, частота и заполненность очередей."""
+
+    def __init__(self, queue_size):
+        """
+        Аргументы:
+            queue_size (int): Емкость каждой очереди
+        """
+        self.queue_size = queue_size
+        self.started = time.perf_counter()
+        self.decoded = 0        # Прочитано кадров
+        self.written = 0        # Записано кадров
+        self.total = None       # Кадров в файле (если известно)
+        # Суммы и максимумы заполненности очередей по замерам при записи
+        self.samples = 0
+        self.occupancy = {"decoded": 0, "processed": 0}
+        self.peak = {"decoded": 0, "processed": 0}
+
+    def sample(self, decoded, processed):
+        """Замер заполненности очередей."""
+        self.samples += 1
+        for name, size in (("decoded", decoded), ("processed", processed)):
+            self.occupancy[name] += size
+            self.peak[name] = max(self.peak[name], size)
+
+    @property
+    def elapsed(self):
+        """Время с начала обработки, с."""
+        return time.perf_counter() - self.started
+
+    @property
+    def fps(self):
+        """Средняя частота записи кадров."""
+        elapsed = self.elapsed
+        return self.written / elapsed if elapsed > 0 else 0.0
+
+    def mean_occupancy(self, name):
+        """Средняя заполненность очереди (0-1)."""
+        if not self.samples:
+            return 0.0
+        return self.occupancy[name] / self.samples / self.queue_size
+
+    def summary(self):
+        """Строка с частотой кадров и заполненностью очередей."""
+        total = f"/{self.total}" if self.total else ""
+        return (
+            f"кадр {self.written}{total}, {self.fps:.1f} кадр/с, "
+            f"очереди: декодированные "
+            f"{self.mean_occupancy('decoded'):.0%} "
+            f"(макс. {self.peak['decoded']}/{self.queue_size}), "
+            f"обработанные {self.mean_occupancy('processed'):.0%} "
+            f"(макс. {self.peak['processed']}/{self.queue_size})"
+        )
+
+
+def fourcc_for(path):
+    """Кодек для выходного файла по расширению."""
+    return FOURCC.get(os.path.splitext(path)[1].lower(), DEFAULT_FOURCC)
+
+
+def process_frame(frame, stages, pool):
+    """
+    Обработка кадра BGR на месте.
+
+    Аргументы:
+        frame (np.ndarray): Кадр BGR (изменяется)
+        stages (list): Скомпилированный рецепт (fusion.compile_recipe)
+        pool (buffers.BufferPool): Пул промежуточных буферов
+
+    Возвращает:
+        np.ndarray: Тот же массив с результатом в BGR
+    """
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+    result = fusion.run_compiled(rgb, stages, dst=rgb, pool=pool)
+    return cv2.cvtColor(result, cv2.COLOR_RGB2BGR, dst=frame)
+
+
+class VideoPipeline:
+    """Конвейер декодирование -> обработка -> кодирование."""
+
+    def __init__(self, recipe, workers=None, queue_size=DEFAULT_QUEUE_SIZE,
+                 progress=None):
+        """
+        Аргументы:
+            recipe (list): Список кортежей (имя операции, параметры)
+            workers (int): Число рабочих потоков (по умолчанию - число
+                ядер)
+            queue_size (int): Емкость каждой очереди между стадиями
+            progress (callable): Функция progress(stats), вызываемая
+                потоком кодирования после каждого кадра, или None
+        """
+        self.stages = fusion.compile_recipe(recipe)
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.progress = progress
+        self.stats = PipelineStats(queue_size)
+        # Кадры в очередях, в обработке и в буфере переупорядочивания
+        self.frames = buffers.BufferPool(
+            max_free=2 * queue_size + 2 * self.workers)
+        self.scratch = buffers.BufferPool()
+        self._decoded = queue.Queue(maxsize=queue_size)
+        self._processed = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._errors = []
+
+    def _put(self, target, item):
+        """Постановка в очередь с ожиданием места; False при остановке."""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source):
+        """Получение из очереди с ожиданием; _END при остановке."""
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=PUT_TIMEOUT)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _fail(self, error):
+        """Остановка всех стадий из-за ошибки."""
+        self._errors.append(error)
+        self._stop.set()
+
+    def _decode(self, capture, shape):
+        """Стадия чтения кадров в буферы из пула."""
+        try:
+            index = 0
+            while not self._stop.is_set():
+                buffer = self.frames.acquire(shape)
+                with tracing.span("video:decode", frame=index):
+                    ok, frame = capture.read(buffer)
+                if not ok or frame is None or frame is not buffer:
+                    # Кадр не записан в буфер (конец или другой размер)
+                    self.frames.release(buffer)
+                if not ok or frame is None:
+                    break
+                if frame.shape != shape:
+                    raise ValueError(
+                        f"Кадр {index}: размер {frame.shape} вместо {shape}")
+                if not self._put(self._decoded, (index, frame)):
+                    return
+                self.stats.decoded = index = index + 1
+        except Exception as e:  # pylint: disable=broad-except
+            self._fail(e)
+        finally:
+            # Каждый рабочий поток получает свой признак конца
+            for _ in range(self.workers):
+                self._put(self._decoded, _END)
+
+    def _process(self):
+        """Стадия применения рецепта (выполняется в нескольких потоках)."""
+        try:
+            while True:
+                item = self._get(self._decoded)
+                if item is _END:
+                    break
+                index, frame = item
+                with tracing.span("video:process", frame=index):
+                    process_frame(frame, self.stages, self.scratch)
+                if not self._put(self._processed, (index, frame)):
+                    return
+        except Exception as e:  # pylint: disable=broad-except
+            self._fail(e)
+        finally:
+            self._put(self._processed, _END)
+
+    def _encode(self, writer):
+        """Стадия записи кадров в исходном порядке."""
+        pending = {}
+        finished = 0
+        try:
+            while finished < self.workers:
+                item = self._get(self._processed)
+                if item is _END:
+                    if self._stop.is_set():
+                        return
+                    finished += 1
+                    continue
+                index, frame = item
+                pending[index] = frame
+                # Кадры, обработанные раньше предыдущих, ждут своей
+                # очереди; их число ограничено числом кадров в работе
+                while self.stats.written in pending:
+                    frame = pending.pop(self.stats.written)
+                    with tracing.span("video:encode",
+                                      frame=self.stats.written):
+                        writer.write(frame)
+                    self.frames.release(frame)
+                    self.stats.written += 1
+                    self.stats.sample(self._decoded.qsize(),
+                                      self._processed.qsize())
+                    if self.progress is not None:
+                        self.progress(self.stats)
+        except BaseException as e:  # pylint: disable=broad-except
+            # Исключение обработчика прогресса (например, отмена задачи)
+            # тоже останавливает конвейер
+            self._fail(e)
+
+    def run(self, input_path, output_path, fourcc=None):
+        """
+        Обработка видеофайла.
+
+        Аргументы:
+            input_path (str): Входной видеофайл
+            output_path (str): Выходной видеофайл
+            fourcc (str): Кодек из четырех символов (по умолчанию - по
+                расширению выходного файла)
+
+        Возвращает:
+            PipelineStats: Итоговые счетчики
+
+        Исключения:
+            OSError: Файл не удалось открыть или создать
+            Exception: Первая ошибка одной из стадий
+        """
+        capture = cv2.VideoCapture(input_path)
+        if not capture.isOpened():
+            raise OSError(f"Не удалось открыть видео: {input_path}")
+        writer = None
+        try:
+            width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            fps = capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+            total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            self.stats.total = total if total > 0 else None
+
+            writer = cv2.VideoWriter(
+                output_path,
+                cv2.VideoWriter_fourcc(*(fourcc or fourcc_for(output_path))),
+                fps, (width, height))
+            if not writer.isOpened():
+                raise OSError(f"Не удалось создать видео: {output_path}")
+
+            self.stats.started = time.perf_counter()
+            threads = [threading.Thread(
+                target=self._decode, args=(capture, (height, width, 3)),
+                name="video-decode", daemon=True)]
+            threads += [
+                threading.Thread(target=self._process,
+                                 name=f"video-process-{number}", daemon=True)
+                for number in range(self.workers)
+            ]
+            threads.append(threading.Thread(
+                target=self._encode, args=(writer,), name="video-encode",
+                daemon=True))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            capture.release()
+            if writer is not None:
+                writer.release()
+
+        if self._errors:
+            raise self._errors[0]
+        return self.stats
+
+
+def process_video(input_path, recipe, output_path, workers=None,
+                  queue_size=DEFAULT_QUEUE_SIZE, fourcc=None, progress=None):
+    """
+    Применение рецепта ко всем кадрам видеофайла.
+
+    Аргументы:
+        input_path (str): Входной видеофайл
+        recipe (list): Список кортежей (имя операции, параметры)
+        output_path (str): Выходной видеофайл
+        workers (int): Число рабочих потоков (по умолчанию - число ядер)
+        queue_size (int): Емкость каждой очереди между стадиями
+        fourcc (str): Кодек (по умолчанию - по расширению)
+        progress (callable): Функция progress(stats) или None
+
+    Возвращает:
+        PipelineStats: Итоговые счетчики
+    """
+    pipeline = VideoPipeline(recipe, workers, queue_size, progress)
+    return pipeline.run(input_path, output_path, fourcc)
+
+
+def main(argv=None):
+    """Точка входа командной строки."""
+    parser = argparse.ArgumentParser(
+        prog="python -m video",
+        description="Обработка видеофайла по рецепту"
+    )
+    parser.add_argument("input", help="Входной видеофайл")
+    parser.add_argument(
+        "recipe",
+        help="Операции через запятую, например "
+             "channel=red,brightness=30,grayscale,line=0:0:99:99:3"
+    )
+    parser.add_argument("output", help="Выходной видеофайл")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Число рабочих потоков (по умолчанию - все "
+                             "ядра)")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Емкость очередей между стадиями, кадров")
+    parser.add_argument("--fourcc", default=None,
+                        help="Кодек из четырех символов (по умолчанию - по "
+                             "расширению выходного файла)")
+    args = parser.parse_args(argv)
+
+    try:
+        recipe = operations.parse_recipe(args.recipe)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.queue_size < 1:
+        parser.error("--queue-size должен быть положительным")
+    if args.fourcc is not None and len(args.fourcc) != 4:
+        parser.error("--fourcc должен состоять из четырех символов")
+
+    # Параллелизм обеспечивают рабочие потоки конвейера
+    cv2.setNumThreads(1)
+    last_report = [0.0]
+
+    def report(stats):
+        """Вывод хода обработки не чаще раза в секунду."""
+        if stats.elapsed - last_report[0] >= 1:
+            last_report[0] = stats.elapsed
+            print(stats.summary(), file=sys.stderr)
+
+    try:
+        stats = process_video(args.input, recipe, args.output, args.workers,
+                              args.queue_size, args.fourcc, report)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    print(f"Готово за {stats.elapsed:.2f} с: {stats.summary()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+"""
+Отображение изображения на холсте тайлами с масштабированием.
+
+Холст делится на квадратные тайлы экранного размера, и в
+ImageTk.PhotoImage преобразуются только тайлы, попадающие в видимую
+область при текущем масштабе. Готовые тайлы хранятся в LRU-кэше, так
+что прокрутка и возврат к прежнему масштабу не требуют повторного
+преобразования, а правка изображения сбрасывает только затронутые ею
+тайлы. Стоимость отображения зависит от размера окна, а не изображения.
+"""
+
+import math
+from collections import OrderedDict
+
+import cv2  # pylint: disable=import-error
+import numpy as np
+from PIL import Image, ImageTk
+
+import tracing
+
+TILE_SIZE = 256         # Сторона тайла на экране, пикс.
+MAX_TILES = 256         # Число хранимых преобразованных тайлов
+ZOOM_STEP = 1.25        # Множитель масштаба за одно деление колеса
+MIN_ZOOM = 1 / 64       # Наименьший масштаб
+MAX_ZOOM = 32           # Наибольший масштаб
+FALLBACK_VIEW_SIZE = 800  # Размер холста, пока окно не отображено
+EDGE_MARGIN = 3         # Запас при сбросе тайлов, пикс. изображения
+
+
+def tile_pixels(image, factor, x0, y0, width, height):
+    """
+    Пиксели прямоугольника экрана при заданном масштабе.
+
+    Аргументы:
+        image (np.ndarray): Отображаемое изображение
+        factor (float): Пикселей изображения на пиксель экрана
+        x0 (int): Левый край прямоугольника на экране
+        y0 (int): Верхний край прямоугольника на экране
+        width (int): Ширина прямоугольника
+        height (int): Высота прямоугольника
+
+    Возвращает:
+        np.ndarray: Изображение размером (height, width)
+    """
+    img_h, img_w = image.shape[:2]
+    if factor > 1:
+        # Уменьшение: усреднение по площади
+        ix0 = min(int(x0 * factor), img_w - 1)
+        iy0 = min(int(y0 * factor), img_h - 1)
+        ix1 = max(min(math.ceil((x0 + width) * factor), img_w), ix0 + 1)
+        iy1 = max(min(math.ceil((y0 + height) * factor), img_h), iy0 + 1)
+        return cv2.resize(image[iy0:iy1, ix0:ix1], (width, height),
+                          interpolation=cv2.INTER_AREA)
+
+    # Увеличение: ближайший пиксель по точному отображению координат,
+    # поэтому на стыках тайлов нет сдвигов
+    cols = ((np.arange(x0, x0 + width) + 0.5) * factor).astype(np.intp)
+    rows = ((np.arange(y0, y0 + height) + 0.5) * factor).astype(np.intp)
+    np.minimum(cols, img_w - 1, out=cols)
+    np.minimum(rows, img_h - 1, out=rows)
+    return image[rows[:, np.newaxis], cols]
+
+
+class Viewport:
+    """Видимая область холста с масштабом и кэшем тайлов."""
+
+    def __init__(self, canvas, on_zoom=None, tile_size=TILE_SIZE,
+                 max_tiles=MAX_TILES):
+        """
+        Аргументы:
+            canvas (tk.Canvas): Холст для отображения
+            on_zoom (callable): Обработчик on_zoom(масштаб) после
+                изменения масштаба или None
+            tile_size (int): Сторона тайла на экране
+            max_tiles (int): Число хранимых тайлов
+        """
+        self.canvas = canvas
+        self.on_zoom = on_zoom
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.image = None          # Отображаемое изображение
+        self.source_shape = None   # Размер исходного изображения (h, w)
+        self.zoom = 1.0            # Пикселей экрана на пиксель исходного
+        # (масштаб, ширина изображения, столбец, строка) -> PhotoImage
+        self.tiles = OrderedDict()
+        # (столбец, строка) -> [элемент холста, ключ тайла, PhotoImage]
+        self.items = {}
+
+    def bind(self):
+        """Привязка прокрутки, перетаскивания и масштаба колесом."""
+        self.canvas.bind("<Configure>", lambda event: self.render())
+        self.canvas.bind("<ButtonPress-1>",
+                         lambda event: self.canvas.scan_mark(event.x,
+                                                             event.y))
+        self.canvas.bind("<B1-Motion>", self._drag)
+        self.canvas.bind("<MouseWheel>", self._wheel)
+        self.canvas.bind("<Button-4>", self._wheel)
+        self.canvas.bind("<Button-5>", self._wheel)
+
+    @property
+    def display_size(self):
+        """Размер изображения на экране при текущем масштабе (w, h)."""
+        height, width = self.source_shape
+        return (max(1, round(width * self.zoom)),
+                max(1, round(height * self.zoom)))
+
+    def view_size(self):
+        """Размер видимой области холста (w, h)."""
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if width <= 1 or height <= 1:
+            return FALLBACK_VIEW_SIZE, FALLBACK_VIEW_SIZE
+        return width, height
+
+    def fit_zoom(self):
+        """Масштаб, при котором изображение целиком помещается в окне
+        (но не больше 1:1)."""
+        height, width = self.source_shape
+        view_w, view_h = self.view_size()
+        return min(1.0, view_w / width, view_h / height)
+
+    def target_size(self):
+        """Длина большей стороны изображения на экране; по ней
+        выбирается уровень пирамиды."""
+        return max(self.display_size)
+
+    def reset(self, source_shape):
+        """
+        Новое исходное изображение: масштаб по размеру окна и пустой кэш.
+
+        Аргументы:
+            source_shape (tuple): Размер исходного изображения
+        """
+        self.source_shape = tuple(source_shape[:2])
+        self.zoom = self.fit_zoom()
+        self.clear()
+        self.canvas.xview_moveto(0)
+        self.canvas.yview_moveto(0)
+        if self.on_zoom is not None:
+            self.on_zoom(self.zoom)
+
+    def clear(self):
+        """Сброс всех тайлов (показанные остаются до перерисовки)."""
+        self.tiles.clear()
+        for item in self.items.values():
+            item[1] = None
+
+    def remove_image(self):
+        """Удаление изображения и всех его тайлов с холста."""
+        for item in self.items.values():
+            self.canvas.delete(item[0])
+        self.items.clear()
+        self.tiles.clear()
+        self.image = None
+        self.source_shape = None
+
+    def invalidate(self, regions):
+        """
+        Сброс тайлов, пересекающих измененные области.
+
+        Аргументы:
+            regions (list): Прямоугольники (x0, y0, x1, y1) в координатах
+                исходного изображения
+        """
+        if not regions:
+            return
+        width = self.source_shape[1]
+        size = self.tile_size
+
+        def touched(key):
+            zoom, image_width, col, row = key
+            # Запас покрывает округление координат на уменьшенных копиях
+            margin = EDGE_MARGIN * width / image_width
+            left, top = col * size / zoom, row * size / zoom
+            right, bottom = left + size / zoom, top + size / zoom
+            return any(
+                left < x1 + margin and x0 - margin < right and
+                top < y1 + margin and y0 - margin < bottom
+                for x0, y0, x1, y1 in regions
+            )
+
+        for key in [key for key in self.tiles if touched(key)]:
+            del self.tiles[key]
+        for item in self.items.values():
+            if item[1] is not None and touched(item[1]):
+                item[1] = None
+
+    def set_image(self, image, source_shape=None, dirty=None):
+        """
+        Замена отображаемого изображения.
+
+        Аргументы:
+            image (np.ndarray): Изображение (возможно, уменьшенная копия
+                исходного)
+            source_shape (tuple): Размер исходного изображения; если он
+                изменился, масштаб подбирается по окну заново
+            dirty (list): Измененные области в координатах исходного
+                изображения или None - изменилось все
+        """
+        if source_shape is None:
+            source_shape = self.source_shape or image.shape
+        if tuple(source_shape[:2]) != self.source_shape:
+            self.reset(source_shape)
+        elif dirty is None:
+            self.clear()
+        else:
+            self.invalidate(dirty)
+        self.image = image
+        self.render()
+
+    def set_zoom(self, zoom, x=None, y=None):
+        """
+        Изменение масштаба с сохранением точки под курсором.
+
+        Аргументы:
+            zoom (float): Новый масштаб
+            x (int): Координата точки в окне (по умолчанию - центр)
+            y (int): Координата точки в окне (по умолчанию - центр)
+        """
+        if self.source_shape is None:
+            return
+        zoom = min(max(zoom, MIN_ZOOM), MAX_ZOOM)
+        if zoom == self.zoom:
+            return
+        view_w, view_h = self.view_size()
+        x = view_w / 2 if x is None else x
+        y = view_h / 2 if y is None else y
+        source_x = self.canvas.canvasx(x) / self.zoom
+        source_y = self.canvas.canvasy(y) / self.zoom
+
+        self.zoom = zoom
+        width, height = self.display_size
+        self.canvas.config(scrollregion=(0, 0, width, height))
+        self.canvas.xview_moveto((source_x * zoom - x) / width)
+        self.canvas.yview_moveto((source_y * zoom - y) / height)
+        self.render()
+        if self.on_zoom is not None:
+            self.on_zoom(zoom)
+
+    def zoom_by(self, factor, x=None, y=None):
+        """Умножение масштаба на factor."""
+        self.set_zoom(self.zoom * factor, x, y)
+
+    def fit(self):
+        """Масштаб по размеру окна."""
+        if self.source_shape is not None:
+            self.set_zoom(self.fit_zoom(), 0, 0)
+
+    def xview(self, *args):
+        """Горизонтальная прокрутка (команда полосы прокрутки)."""
+        self.canvas.xview(*args)
+        self.render()
+
+    def yview(self, *args):
+        """Вертикальная прокрутка (команда полосы прокрутки)."""
+        self.canvas.yview(*args)
+        self.render()
+
+    def _drag(self, event):
+        """Перетаскивание изображения мышью."""
+        self.canvas.scan_dragto(event.x, event.y, gain=1)
+        self.render()
+
+    def _wheel(self, event):
+        """Масштабирование колесом мыши относительно курсора."""
+        zoom_in = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.zoom_by(ZOOM_STEP if zoom_in else 1 / ZOOM_STEP,
+                     event.x, event.y)
+
+    def _tile(self, key, factor):
+        """Тайл из кэша или новый преобразованный тайл."""
+        photo = self.tiles.get(key)
+        if photo is not None:
+            self.tiles.move_to_end(key)
+            return photo
+
+        _, _, col, row = key
+        width, height = self.display_size
+        x0, y0 = col * self.tile_size, row * self.tile_size
+        with tracing.span("resize"):
+            pixels = tile_pixels(self.image, factor, x0, y0,
+                                 min(self.tile_size, width - x0),
+                                 min(self.tile_size, height - y0))
+        with tracing.span("fromarray"):
+            image = Image.fromarray(pixels)
+        with tracing.span("photo"):
+            photo = ImageTk.PhotoImage(image)
+        self.tiles[key] = photo
+        while len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+        return photo
+
+    def render(self):
+        """Отображение тайлов, попадающих в видимую область."""
+        if self.image is None or self.source_shape is None:
+            return
+        width, height = self.display_size
+        self.canvas.config(scrollregion=(0, 0, width, height))
+        view_w, view_h = self.view_size()
+        left = max(0, int(self.canvas.canvasx(0)))
+        top = max(0, int(self.canvas.canvasy(0)))
+        size = self.tile_size
+        visible = [
+            (col, row)
+            for row in range(top // size,
+                             (min(height, top + view_h) - 1) // size + 1)
+            for col in range(left // size,
+                             (min(width, left + view_w) - 1) // size + 1)
+        ]
+
+        for position in [p for p in self.items if p not in visible]:
+            self.canvas.delete(self.items.pop(position)[0])
+
+        image_width = self.image.shape[1]
+        factor = image_width / (self.source_shape[1] * self.zoom)
+        stale = []
+        for col, row in visible:
+            key = (self.zoom, image_width, col, row)
+            item = self.items.get((col, row))
+            if item is None or item[1] != key:
+                stale.append((col, row, key, item))
+
+        with tracing.span("tiles", count=sum(
+                key not in self.tiles for _, _, key, _ in stale)):
+            for col, row, key, item in stale:
+                photo = self._tile(key, factor)
+                with tracing.span("canvas"):
+                    if item is None:
+                        self.items[(col, row)] = [
+                            self.canvas.create_image(
+                                col * size, row * size, anchor="nw",
+                                image=photo),
+                            key, photo
+                        ]
+                    else:
+                        self.canvas.itemconfigure(item[0], image=photo)
+                        item[1:] = [key, photo]
@@ -0,0 +1,236 @@
+"""
+Рабочая область с несколькими открытыми изображениями.
+
+Каждый документ хранит свою цепочку операций (с общим кэшем
+результатов), слой линий и историю правок. Пиксели исходных
+изображений и их пирамид ограничены общим бюджетом памяти: при его
+превышении давно не просматривавшиеся документы выгружаются на диск
+в несжатые файлы .npy и дальше читаются через отображение в память.
+Страницы такого файла система подгружает при обращении и может
+освободить без записи в подкачку, поэтому открытыми остаются десятки
+больших изображений. Сжатие не используется: фотографии сжимаются
+плохо, а распаковка потребовала бы заново держать изображение
+целиком в памяти.
+"""
+
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_BUDGET = 4 * 1024 ** 3  # Бюджет памяти изображений, байт
+
+
+class Document:
+    """Открытое изображение с состоянием его правки."""
+
+    _ids = itertools.count()
+
+    def __init__(self, title, graph, overlay, history, path=None):
+        """
+        Аргументы:
+            title (str): Название для списка документов
+            graph (graph.OperationGraph): Цепочка с исходным изображением
+            overlay (annotations.LineLayer): Слой линий
+            history (history.History): История правок
+            path (str): Путь к файлу или None
+        """
+        self.id = next(self._ids)
+        self.title = title
+        self.graph = graph
+        self.overlay = overlay
+        self.history = history
+        self.path = path
+        self.spilled = False  # Пиксели отображены из файлов на диске
+
+    @property
+    def nbytes(self):
+        """Размер пикселей исходного изображения и пирамиды."""
+        return sum(level.nbytes for level in self.graph.levels)
+
+
+class Workspace:
+    """
+    Документы в порядке списка и в порядке последнего просмотра.
+
+    Выгрузка (spill) выполняется в фоновом потоке, остальные методы -
+    в главном.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET, directory=None):
+        """
+        Аргументы:
+            budget (int): Наибольший размер изображений в памяти, байт
+            directory (str): Каталог для выгрузки (по умолчанию -
+                временный, удаляется при shutdown)
+        """
+        self.budget = budget
+        self.documents = []
+        self.active = None
+        self._viewed = OrderedDict()  # id -> документ, давние первыми
+        self._files = {}              # id -> файлы выгруженного документа
+        self._directory = directory
+        self._own_directory = directory is None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    @property
+    def resident(self):
+        """Суммарный размер изображений в памяти, байт."""
+        return sum(self.resident_bytes(document)
+                   for document in self.documents)
+
+    def resident_bytes(self, document):
+        """
+        Память, занимаемая пикселями документа.
+
+        Выгруженный документ не занимает память, пока его не смотрят;
+        активный выгруженный документ считается полностью
+        подгруженным, так как его страницы читаются при просмотре.
+        """
+        if document.spilled and document is not self.active:
+            return 0
+        return document.nbytes
+
+    @property
+    def directory(self):
+        """Каталог выгрузки (создается при первой выгрузке)."""
+        with self._lock:
+            if self._directory is None:
+                self._directory = tempfile.mkdtemp(prefix="imgproc-")
+            return self._directory
+
+    def find(self, path):
+        """Открытый документ файла или None."""
+        for document in self.documents:
+            if document.path is not None and document.path == path:
+                return document
+        return None
+
+    def add(self, document, replace=None):
+        """
+        Добавление документа (без активации).
+
+        Аргументы:
+            document (Document): Новый документ
+            replace (Document): Документ, который новый заменяет в
+                списке, или None - добавить в конец
+        """
+        if replace is not None and replace in self.documents:
+            self.documents[self.documents.index(replace)] = document
+            self._forget(replace)
+        else:
+            self.documents.append(document)
+        self._viewed[document.id] = document
+
+    def activate(self, document):
+        """Выбор документа для просмотра и правки."""
+        self.active = document
+        self._viewed.move_to_end(document.id)
+
+    def close(self, document):
+        """
+        Закрытие документа с удалением его файлов выгрузки.
+
+        Возвращает:
+            Document: Соседний документ для показа или None
+        """
+        index = self.documents.index(document)
+        del self.documents[index]
+        self._forget(document)
+        if self.active is document:
+            self.active = None
+        if not self.documents:
+            return None
+        return self.documents[min(index, len(self.documents) - 1)]
+
+    def _forget(self, document):
+        """Удаление документа из порядка просмотра и его файлов."""
+        with self._lock:
+            self._viewed.pop(document.id, None)
+            paths = self._files.pop(document.id, [])
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def to_spill(self):
+        """
+        Документы для выгрузки, чтобы уложиться в бюджет.
+
+        Выбираются давно не просматривавшиеся документы, кроме
+        активного.
+
+        Возвращает:
+            list: Документы, начиная с самого давнего
+        """
+        excess = self.resident - self.budget
+        documents = []
+        for document in self._viewed.values():
+            if excess <= 0:
+                break
+            if document is self.active or document.spilled:
+                continue
+            documents.append(document)
+            excess -= document.nbytes
+        return documents
+
+    def spill(self, document):
+        """
+        Выгрузка пикселей документа на диск (в фоновом потоке).
+
+        Уровни пирамиды записываются в файлы .npy и заменяются
+        отображениями этих файлов в память только для чтения, так что
+        результаты и ключи кэша остаются прежними.
+
+        Аргументы:
+            document (Document): Документ для выгрузки
+
+        Возвращает:
+            int: Освобожденный объем памяти, байт
+        """
+        if document.spilled:
+            return 0
+        source = document.graph
+        key, levels = source.source_key, source.levels
+        directory = self.directory
+        paths, mapped = [], []
+        try:
+            for index, level in enumerate(levels):
+                path = os.path.join(directory, f"{document.id}-{index}.npy")
+                paths.append(path)
+                np.save(path, level)
+                mapped.append(np.load(path, mmap_mode="r"))
+        except BaseException:
+            for path in paths:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            raise
+
+        with self._lock:
+            closed = document.id not in self._viewed
+            if not closed:
+                self._files[document.id] = paths
+        if closed:
+            # Документ закрыт во время записи
+            for path in paths:
+                os.unlink(path)
+            return 0
+        freed = document.nbytes
+        source.set_source(mapped[0], key, mapped)
+        document.spilled = True
+        return freed
+
+    def shutdown(self):
+        """Удаление временного каталога выгрузки."""
+        if self._own_directory and self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)